@@ -5,6 +5,12 @@ import networkx as nx
 import pandas as pd
 from tqdm import tqdm
 import pickle
+import os
+import sys
+
+# Shared single-pass PGN replay lives alongside the PGN to matrix scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pgn_to_matrix'))
+from pgn_positions import iter_pgn_positions
 
 
 # Unicode chess symbols
@@ -265,10 +271,17 @@ def build_graph(fen):
 
 
 
-# Reads csv file of game data.
-filename = 'stockfish_scores_depth_20_interim.csv'
-df = pd.read_csv(filename)
-FENs = list(df['FEN'])
+# Optionally builds graphs straight from a PGN file, instead of the stockfish scores csv.
+pgn_file = None
+
+if pgn_file is None:
+    # Reads csv file of game data.
+    filename = 'stockfish_scores_depth_20_interim.csv'
+    df = pd.read_csv(filename)
+    FENs = list(df['FEN'])
+else:
+    # Replays each game once, collecting the position after every move.
+    FENs = [fen for _, _, fen, _ in iter_pgn_positions(pgn_file)]
 
 # Initialises list to hold graphs.
 graphs_list = []
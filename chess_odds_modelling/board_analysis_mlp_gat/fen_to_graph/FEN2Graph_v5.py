@@ -0,0 +1,102 @@
+import os
+import sys
+from multiprocessing import Pool
+
+import pandas as pd
+from tqdm import tqdm
+
+from graph_builder import build_graph_arrays, build_graph_arrays_from_features
+from graph_store import GraphStoreWriter, concatenate_graphs, save_shard
+from position_features import PositionFeatureStore
+
+# Shared single-pass PGN replay lives alongside the PGN to matrix scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pgn_to_matrix'))
+from pgn_positions import iter_pgn_positions
+
+
+# Optionally builds graphs straight from a PGN file, instead of the stockfish scores csv.
+pgn_file = None
+
+# Sharded graph store to write to, and the number of graphs per shard.
+graph_store = 'knowledge_graph_store'
+shard_size = 10000
+
+# Number of worker processes converting FENs (1 converts in this process, one graph at a time).
+num_workers = os.cpu_count()
+
+# Optional precomputed position features (see position_features.py), read instead of re-deriving attacks per FEN.
+feature_store = None
+
+
+def build_graphs(fens, features_path=None):
+    '''
+    Builds the graphs of a list of FENs, from the feature store if one is given (positions missing from it are computed).
+
+    :return: List of (x, edge_index, edge_attr) tuples.
+    '''
+    if features_path is None:
+        return [build_graph_arrays(fen) for fen in fens]
+    features = PositionFeatureStore(features_path).lookup(fens)
+    return [build_graph_arrays_from_features(f) for f in features]
+
+
+def convert_chunk(args):
+    '''
+    Converts a contiguous chunk of FENs into graphs and saves them as one shard of the store.
+
+    :param args: Tuple of (store directory, row of the chunk's first FEN, FENs, targets, feature store or None).
+    :return: Index entry for the saved shard.
+    '''
+    store_path, start, fens, chunk_targets, features_path = args
+    graphs = build_graphs(fens, features_path)
+    shard = concatenate_graphs([g[0] for g in graphs], [g[1] for g in graphs], [g[2] for g in graphs], chunk_targets)
+    return save_shard(store_path, start, shard)
+
+
+if __name__ == '__main__':
+
+    if pgn_file is None:
+        # Reads csv file of game data.
+        filename = 'stockfish_scores_depth_20_interim.csv'
+        df = pd.read_csv(filename)
+        FENs = list(df['FEN'])
+        targets = list(df['stockfish_score'])
+    else:
+        # Replays each game once, collecting the position after every move (no targets yet).
+        FENs = [fen for _, _, fen, _ in iter_pgn_positions(pgn_file, num_workers=num_workers)]
+        targets = [None] * len(FENs)
+
+    print('Processing chess FENs into knowledge graphs:')
+
+    # Streams graphs into fixed-size shards, so only one shard per process is ever held in memory.
+    with GraphStoreWriter(graph_store, shard_size=shard_size, source=filename if pgn_file is None else pgn_file) as writer:
+
+        if num_workers > 1:
+            # Splits the FENs into contiguous chunks (at least a few per worker, to balance the load),
+            # each converted and saved as a shard by a worker; the index keeps every shard's starting row.
+            chunk_size = min(shard_size, max(1, -(-len(FENs) // (num_workers * 4))))
+            chunks = [(graph_store, start, FENs[start:start + chunk_size], targets[start:start + chunk_size], feature_store)
+                      for start in range(0, len(FENs), chunk_size)]
+
+            with Pool(num_workers) as pool, tqdm(total=len(FENs)) as progress:
+                # Registers shards as they finish, in whatever order that is.
+                for entry in pool.imap_unordered(convert_chunk, chunks):
+                    writer.add_shard(entry)
+                    progress.update(entry['num_graphs'])
+
+        elif feature_store is not None:
+            # Reads features a shard's worth of FENs at a time.
+            for start in tqdm(range(0, len(FENs), shard_size)):
+                graphs = build_graphs(FENs[start:start + shard_size], feature_store)
+                for (x, edge_index, edge_attr), target in zip(graphs, targets[start:start + shard_size]):
+                    writer.append(x, edge_index, edge_attr, target)
+
+        else:
+            # Iterates through FENs.
+            for fen, target in tqdm(zip(FENs, targets), total=len(FENs)):
+
+                # Finds positional graph, as PyG-ready arrays (bitboards, no networkx).
+                x, edge_index, edge_attr = build_graph_arrays(fen)
+
+                # Appends graph to the store (a shard is written every shard_size graphs, and at the end).
+                writer.append(x, edge_index, edge_attr, target)
@@ -0,0 +1,102 @@
+'''
+Bitboard-based knowledge graph builder, producing PyG-ready arrays directly (no networkx).
+
+Follows the graph definition in gnn_strategy.txt and FEN2Graph_v4.build_graph:
+- One node per piece, in ascending square order (a1, b1, ..., h8), with features
+  [colour (0 white, 1 black), piece type, points value, file (1-8), rank (1-8)].
+- One edge per pair of pieces (i < j), with the interaction feature 0-3:
+  0 neither piece looks at the other, 1 only A looks at B, 2 only B looks at A, 3 both.
+  A is the white piece for a white/black pair, else the higher-value piece (bishop above knight),
+  else the piece closer to the a-file.
+'''
+
+import chess
+import numpy as np
+
+from position_features import piece_list
+
+
+# Piece-specific node features, indexed by symbol: colour, type, points (as pieces_dict in FEN2Graph_v4).
+PIECE_FEATURES = {
+    'P': (0, 1, 1), 'p': (1, 1, 1),
+    'R': (0, 2, 5), 'r': (1, 2, 5),
+    'N': (0, 3, 3), 'n': (1, 3, 3),
+    'B': (0, 4, 3), 'b': (1, 4, 3),
+    'Q': (0, 5, 9), 'q': (1, 5, 9),
+    'K': (0, 6, 20), 'k': (1, 6, 20),
+}
+
+# Points used only to order same-colour pairs: bishops count slightly above knights.
+ORDERING_POINTS = {1: 1, 2: 5, 3: 3, 4: 3.5, 5: 9, 6: 20}
+_ORDERING_POINTS_LUT = np.array([0] + [ORDERING_POINTS[t] for t in range(1, 7)], dtype=np.float32)
+
+
+def build_graph_arrays(fen):
+    '''
+    Builds the knowledge graph of a position as NumPy arrays, in the format of process_nx_to_pyg (gat_v1.py).
+
+    :param fen: FEN string of the chess position.
+    :return: Tuple of (x, edge_index, edge_attr):
+             x float32 (num_pieces, 5), edge_index int64 (2, num_pairs), edge_attr float32 (num_pairs, 1).
+    '''
+    board = chess.Board(fen)
+    piece_map = board.piece_map()
+    squares = np.array(sorted(piece_map), dtype=np.int64)
+    symbols = [piece_map[square].symbol() for square in squares]
+    attacks = np.array([board.attacks_mask(square) for square in squares], dtype=np.uint64)
+    return _graph_arrays(squares, symbols, attacks)
+
+
+def build_graph_arrays_from_features(features):
+    '''
+    As build_graph_arrays, but from a position's precomputed primitives (see position_features.py), without python-chess.
+
+    :param features: A single position_features.FEATURE_DTYPE record.
+    '''
+    squares, symbols = piece_list(features)
+    return _graph_arrays(squares, symbols, features['attacks'][squares].astype(np.uint64))
+
+
+def pair_interactions(x_i, x_j, i_looks, j_looks):
+    '''
+    Interaction feature (0-3, see module docstring) of pairs of pieces.
+
+    :param x_i: Node features of the first piece of every pair, (num_pairs, 5).
+    :param x_j: Node features of the second piece of every pair, (num_pairs, 5).
+    :param i_looks: Whether the first piece attacks/defends the second, (num_pairs,) bool.
+    :param j_looks: Whether the second piece attacks/defends the first, (num_pairs,) bool.
+    :return: np.ndarray of int64 interactions, (num_pairs,).
+    '''
+    # Decides which piece of each pair is A.
+    points_i = _ORDERING_POINTS_LUT[x_i[:, 1].astype(np.int64)]
+    points_j = _ORDERING_POINTS_LUT[x_j[:, 1].astype(np.int64)]
+    i_is_A = np.where(
+        x_i[:, 0] != x_j[:, 0], x_i[:, 0] == 0,
+        np.where(points_i != points_j, points_i > points_j, x_i[:, 3] < x_j[:, 3])
+    )
+    A_looks = np.where(i_is_A, i_looks, j_looks)
+
+    return np.where(i_looks & j_looks, 3, np.where(i_looks | j_looks, np.where(A_looks, 1, 2), 0))
+
+
+def _graph_arrays(squares, symbols, attacks):
+    # squares in ascending order, with each piece's symbol and attacks bitboard.
+    n = len(squares)
+
+    # Node features.
+    x = np.empty((n, 5), dtype=np.float32)
+    for i, symbol in enumerate(symbols):
+        x[i, :3] = PIECE_FEATURES[symbol]
+    x[:, 3] = squares % 8 + 1
+    x[:, 4] = squares // 8 + 1
+
+    # looks[i, j] is True when piece i attacks/defends the square of piece j.
+    looks = ((attacks[:, None] >> squares.astype(np.uint64)[None, :]) & np.uint64(1)).astype(bool)
+
+    # Every pair of pieces gets an edge.
+    i, j = np.triu_indices(n, k=1)
+    interaction = pair_interactions(x[i], x[j], looks[i, j], looks[j, i])
+
+    edge_index = np.stack([i, j]).astype(np.int64)
+    edge_attr = interaction.astype(np.float32)[:, None]
+    return x, edge_index, edge_attr
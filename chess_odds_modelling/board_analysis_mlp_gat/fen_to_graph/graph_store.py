@@ -0,0 +1,266 @@
+'''
+Append-only, sharded store of knowledge graphs (as built by graph_builder.build_graph_arrays).
+
+A store is a directory with an index.json and one sub-directory per shard. Each shard holds a fixed
+number of consecutive graphs as concatenated arrays, plus offset pointers into them:
+
+    x.npy           int8  (num_nodes, 5)     node features of every graph, back to back
+    edge_index.npy  int16 (2, num_edges)     edge endpoints, local to each graph
+    edge_attr.npy   int8  (num_edges, 1)     interaction features
+    y.npy           float32 (num_graphs,)    stockfish targets (NaN where unknown)
+    node_ptr.npy    int64 (num_graphs + 1,)  graph g's nodes are x[node_ptr[g]:node_ptr[g + 1]]
+    edge_ptr.npy    int64 (num_graphs + 1,)  likewise for edges
+
+Node and edge features are small integers, so they are stored compactly and cast back to
+float32 (and edge_index to int64) on read. Shards are only ever added, never rewritten, so the
+cost of writing a graph does not grow with the size of the store.
+
+The index (manifest) records, for every shard, the row of its first graph in the source data ('start'),
+so shards can be written out of order (e.g. by a process pool) and still be read back in row order.
+'''
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+class GraphStoreWriter:
+    '''
+    Writes graphs to a store incrementally, one fixed-size shard at a time.
+    '''
+
+    def __init__(self, path, shard_size=10000, append=False, source=None):
+        '''
+        :param path: Store directory.
+        :param shard_size: Number of graphs per shard.
+        :param append: Whether to add shards to an existing store, rather than starting a new one.
+        :param source: Optional description of the source data (e.g. csv filename), kept in the index.
+        '''
+        self.path = path
+        self.shard_size = shard_size
+        index_file = os.path.join(path, 'index.json')
+
+        if append and os.path.exists(index_file):
+            with open(index_file, 'r') as f:
+                self.index = json.load(f)
+        else:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+            self.index = {'num_graphs': 0, 'source': source, 'shards': []}
+            self._write_index()
+
+        self.next_start = max((s['start'] + s['num_graphs'] for s in self.index['shards']), default=0)
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self.xs, self.edge_indices, self.edge_attrs, self.ys = [], [], [], []
+
+    def append(self, x, edge_index, edge_attr, y=None):
+        '''
+        Adds a single graph.
+
+        :param x: Node features, shape (num_nodes, num_features).
+        :param edge_index: Edge endpoints, shape (2, num_edges), indexing into x.
+        :param edge_attr: Edge features, shape (num_edges, num_edge_features).
+        :param y: Graph-level target (None if unknown).
+        '''
+        self.xs.append(x)
+        self.edge_indices.append(edge_index)
+        self.edge_attrs.append(edge_attr)
+        self.ys.append(np.nan if y is None else y)
+        if len(self.xs) >= self.shard_size:
+            self.flush()
+
+    def write_shard(self, shard):
+        '''
+        Adds an already concatenated shard (as returned by concatenate_graphs), after the last graph in the store.
+        '''
+        self.add_shard(save_shard(self.path, self.next_start, shard))
+
+    def add_shard(self, entry):
+        '''
+        Registers a shard already saved into the store directory (see save_shard), in any order.
+        '''
+        self.index['shards'].append(entry)
+        self.index['shards'].sort(key=lambda s: s['start'])
+        self.index['num_graphs'] += entry['num_graphs']
+        self.next_start = max(self.next_start, entry['start'] + entry['num_graphs'])
+        # The index is only updated once the shard is fully on disk.
+        self._write_index()
+
+    def flush(self):
+        '''
+        Writes the buffered graphs as a new shard.
+        '''
+        if not self.xs:
+            return
+        self.write_shard(concatenate_graphs(self.xs, self.edge_indices, self.edge_attrs, self.ys))
+        self._reset_buffer()
+
+    def _write_index(self):
+        tmp_file = os.path.join(self.path, 'index.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_file, os.path.join(self.path, 'index.json'))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def concatenate_graphs(xs, edge_indices, edge_attrs, ys):
+    '''
+    Packs lists of per-graph arrays into one shard's concatenated arrays and offset pointers.
+
+    :return: Dict of shard arrays (see module docstring).
+    '''
+    node_counts = [len(x) for x in xs]
+    edge_counts = [e.shape[1] for e in edge_indices]
+    return {
+        'x': np.concatenate(xs).astype(np.int8) if xs else np.empty((0, 5), dtype=np.int8),
+        'edge_index': np.concatenate(edge_indices, axis=1).astype(np.int16) if xs else np.empty((2, 0), dtype=np.int16),
+        'edge_attr': np.concatenate(edge_attrs).astype(np.int8) if xs else np.empty((0, 1), dtype=np.int8),
+        'y': np.array([np.nan if y is None else y for y in ys], dtype=np.float32),
+        'node_ptr': np.concatenate([[0], np.cumsum(node_counts)]).astype(np.int64),
+        'edge_ptr': np.concatenate([[0], np.cumsum(edge_counts)]).astype(np.int64),
+    }
+
+
+def save_shard(path, start, shard):
+    '''
+    Saves one shard's arrays into its own directory of the store. Touches nothing else in the store,
+    so it is safe to call from worker processes; the returned entry is then registered with GraphStoreWriter.add_shard.
+
+    :param path: Store directory.
+    :param start: Row (in the source data) of the shard's first graph.
+    :param shard: Dict of shard arrays, as returned by concatenate_graphs.
+    :return: Index entry for the shard.
+    '''
+    shard_name = f'shard_{start:010d}'
+    shard_dir = os.path.join(path, shard_name)
+    os.makedirs(shard_dir, exist_ok=True)
+    for name, array in shard.items():
+        np.save(os.path.join(shard_dir, f'{name}.npy'), array)
+    return {'dir': shard_name, 'start': start, 'num_graphs': len(shard['y']),
+            'num_nodes': int(shard['node_ptr'][-1]), 'num_edges': int(shard['edge_ptr'][-1])}
+
+
+class GraphStore:
+    '''
+    Lazy, read-only access to a graph store: shards are memory-mapped the first time one of their graphs is read.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            self.index = json.load(f)
+        self.graph_offsets = np.cumsum([0] + [s['num_graphs'] for s in self.index['shards']])
+        starts = [s['start'] for s in self.index['shards']]
+        if starts != list(self.graph_offsets[:-1]):
+            raise ValueError(f'Graph store {path} is incomplete: its shards do not cover consecutive rows.')
+        self._shards = {}
+
+    def __len__(self):
+        return self.index['num_graphs']
+
+    def shard(self, shard_idx):
+        '''
+        Returns the memory-mapped arrays of one shard.
+        '''
+        if shard_idx not in self._shards:
+            shard_dir = os.path.join(self.path, self.index['shards'][shard_idx]['dir'])
+            self._shards[shard_idx] = {
+                name: np.load(os.path.join(shard_dir, f'{name}.npy'), mmap_mode='r')
+                for name in ('x', 'edge_index', 'edge_attr', 'y', 'node_ptr', 'edge_ptr')
+            }
+        return self._shards[shard_idx]
+
+    def locate(self, idx):
+        '''
+        Maps a global graph index to (shard index, index within the shard).
+        '''
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Graph index {idx} out of range for store of {len(self)} graphs.')
+        shard_idx = int(np.searchsorted(self.graph_offsets, idx, side='right')) - 1
+        return shard_idx, idx - int(self.graph_offsets[shard_idx])
+
+    def __getitem__(self, idx):
+        '''
+        Reads one graph.
+
+        :return: Dict with x (float32), edge_index (int64), edge_attr (float32) and y (float, NaN if unknown).
+        '''
+        shard_idx, local = self.locate(idx)
+        shard = self.shard(shard_idx)
+        n0, n1 = shard['node_ptr'][local], shard['node_ptr'][local + 1]
+        e0, e1 = shard['edge_ptr'][local], shard['edge_ptr'][local + 1]
+        return {
+            'x': shard['x'][n0:n1].astype(np.float32),
+            'edge_index': shard['edge_index'][:, e0:e1].astype(np.int64),
+            'edge_attr': shard['edge_attr'][e0:e1].astype(np.float32),
+            'y': float(shard['y'][local]),
+        }
+
+
+def gather_graphs(shard, indices):
+    '''
+    Collates selected graphs of one shard into a single disjoint-union graph, PyG-batch style,
+    with a few vectorised gathers (no per-graph Python objects).
+
+    :param shard: Dict of shard arrays (see module docstring), e.g. from GraphStore.shard.
+    :param indices: Graph indices within the shard.
+    :return: Dict with x (float32), edge_index (int64, offset per graph), edge_attr (float32), y (float32),
+             batch (int64, graph of every node) and ptr (int64, node offset of every graph).
+    '''
+    indices = np.asarray(indices, dtype=np.int64)
+    node_ptr, edge_ptr = shard['node_ptr'], shard['edge_ptr']
+    node_counts = node_ptr[indices + 1] - node_ptr[indices]
+    edge_counts = edge_ptr[indices + 1] - edge_ptr[indices]
+    ptr = np.concatenate([[0], np.cumsum(node_counts)]).astype(np.int64)
+
+    node_rows = _concatenated_ranges(node_ptr[indices], node_counts)
+    edge_rows = _concatenated_ranges(edge_ptr[indices], edge_counts)
+
+    return {
+        'x': shard['x'][node_rows].astype(np.float32),
+        'edge_index': shard['edge_index'][:, edge_rows].astype(np.int64) + np.repeat(ptr[:-1], edge_counts),
+        'edge_attr': shard['edge_attr'][edge_rows].astype(np.float32),
+        'y': shard['y'][indices].astype(np.float32),
+        'batch': np.repeat(np.arange(len(indices), dtype=np.int64), node_counts),
+        'ptr': ptr,
+    }
+
+
+def _concatenated_ranges(starts, counts):
+    # Equivalent to np.concatenate([np.arange(s, s + c) for s, c in zip(starts, counts)]).
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum(), dtype=np.int64) + np.repeat(starts - offsets, counts)
+
+
+def merge_shards(shards):
+    '''
+    Concatenates several shards (in order) into one, re-basing the offset pointers.
+
+    :param shards: List of dicts of shard arrays.
+    :return: Dict of arrays of the merged shard.
+    '''
+    node_offsets = np.cumsum([0] + [int(s['node_ptr'][-1]) for s in shards])
+    edge_offsets = np.cumsum([0] + [int(s['edge_ptr'][-1]) for s in shards])
+    return {
+        'x': np.concatenate([s['x'] for s in shards]),
+        'edge_index': np.concatenate([s['edge_index'] for s in shards], axis=1),
+        'edge_attr': np.concatenate([s['edge_attr'] for s in shards]),
+        'y': np.concatenate([s['y'] for s in shards]),
+        'node_ptr': np.concatenate([s['node_ptr'][:-1] + off for s, off in zip(shards, node_offsets)] + [node_offsets[-1:]]),
+        'edge_ptr': np.concatenate([s['edge_ptr'][:-1] + off for s, off in zip(shards, edge_offsets)] + [edge_offsets[-1:]]),
+    }
@@ -0,0 +1,198 @@
+'''
+Stateful, per-move board encoder for live games: keeps the encodings of the current position up to date by
+applying each move as a delta, instead of re-encoding the whole board from a FEN.
+
+Three encodings are maintained, identical to their from-scratch counterparts:
+- matrix():       signed 8x8 piece matrix, as fen_to_matrix / fen_batch_encoder.fens_to_matrices
+- model_inputs(): chess transformer inputs, as extract_model_inputs_from_fen (generate_chess_embeddings_v5.py)
+- graph_arrays(): knowledge graph, as graph_builder.build_graph_arrays
+
+A move changes the pieces on at most four squares (from, to, a castling rook's two squares, or an en passant
+capture). Only the pieces on those squares, and the sliding pieces whose attacks touched a square that was
+vacated or newly occupied, get their attack sets recomputed; only the graph edges of those pieces are patched.
+'''
+
+import time
+
+import chess
+import numpy as np
+
+from graph_builder import PIECE_FEATURES, build_graph_arrays, pair_interactions
+
+
+# Signed piece values (fen_to_matrix), indexed by symbol.
+PIECE_VALUES = {symbol: (1 if symbol.isupper() else -1) * chess.Piece.from_symbol(symbol).piece_type
+                for symbol in 'PNBRQKpnbrqk'}
+
+_SQUARE_BITS = np.array([1 << square for square in range(64)], dtype=np.uint64)
+
+
+class IncrementalBoardEncoder:
+    '''
+    Board of a live game, with its matrix, transformer input and graph encodings updated move by move.
+    '''
+
+    def __init__(self, fen=None):
+        '''
+        :param fen: Starting position (the standard one by default).
+        '''
+        self.board = chess.Board(fen) if fen else chess.Board()
+        self.values = np.zeros(64, dtype=np.int8)                  # Signed piece value per square (0 if empty).
+        self.node_features = np.zeros((64, 5), dtype=np.float32)   # Graph node features per occupied square.
+        self.attacks = np.zeros(64, dtype=np.uint64)               # Attack bitboard per occupied square.
+        self.looks = np.zeros((64, 64), dtype=bool)                # looks[a, b]: piece on a attacks/defends square b.
+        self.interaction = np.zeros((64, 64), dtype=np.int8)       # Edge feature per pair of occupied squares.
+        self._pairs = {}                                           # Cached np.triu_indices per piece count.
+
+        for square, piece in self.board.piece_map().items():
+            self._place(square, piece)
+        occupied = list(self.board.piece_map())
+        self._update_attacks(occupied)
+        self._update_interactions(occupied)
+
+    def _place(self, square, piece):
+        if piece is None:
+            self.values[square] = 0
+            self.node_features[square] = 0
+            self.attacks[square] = 0
+            self.looks[square] = False
+        else:
+            symbol = piece.symbol()
+            self.values[square] = PIECE_VALUES[symbol]
+            self.node_features[square] = (*PIECE_FEATURES[symbol], square % 8 + 1, square // 8 + 1)
+
+    def _update_attacks(self, squares):
+        squares = np.fromiter(squares, dtype=np.int64)
+        self.attacks[squares] = [self.board.attacks_mask(square) for square in squares]
+        self.looks[squares] = (self.attacks[squares, None] & _SQUARE_BITS) != 0
+
+    def _update_interactions(self, squares):
+        # Recomputes the interaction of every pair involving one of the given (occupied) squares.
+        squares = np.fromiter(squares, dtype=np.int64)
+        occupied = np.flatnonzero(self.values)
+        rows, cols = np.repeat(squares, len(occupied)), np.tile(occupied, len(squares))
+        codes = pair_interactions(self.node_features[rows], self.node_features[cols], self.looks[rows, cols], self.looks[cols, rows])
+        self.interaction[rows, cols] = codes
+        self.interaction[cols, rows] = codes
+
+    def push(self, move):
+        '''
+        Plays a move, updating the encodings.
+
+        :param move: chess.Move (legal in the current position).
+        :return: Sorted list of the squares whose piece or attack set changed.
+        '''
+        board = self.board
+        candidates = {move.from_square, move.to_square}
+        if board.is_castling(move):
+            candidates |= set(chess.SquareSet(chess.BB_RANKS[chess.square_rank(move.from_square)]))
+        elif board.is_en_passant(move):
+            candidates.add(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+
+        before = {square: board.piece_at(square) for square in candidates}
+        board.push(move)
+        changed = {square for square in candidates if board.piece_at(square) != before[square]}
+
+        # Squares that were vacated or newly occupied can open or block sliding pieces' lines.
+        flipped = 0
+        for square in changed:
+            if (before[square] is None) != (board.piece_at(square) is None):
+                flipped |= chess.BB_SQUARES[square]
+
+        for square in changed:
+            self._place(square, board.piece_at(square))
+        refresh = {square for square in changed if board.piece_at(square) is not None}
+        for square in chess.scan_forward(board.occupied & (board.bishops | board.rooks | board.queens)):
+            if int(self.attacks[square]) & flipped:
+                refresh.add(square)
+
+        self._update_attacks(refresh)
+        self._update_interactions(refresh)
+        return sorted(changed | refresh)
+
+    def push_san(self, san):
+        move = self.board.parse_san(san)
+        self.push(move)
+        return move
+
+    def push_uci(self, uci):
+        move = self.board.parse_uci(uci)
+        self.push(move)
+        return move
+
+    def fen(self):
+        return self.board.fen()
+
+    def matrix(self):
+        '''
+        Signed 8x8 piece matrix, rank 1 in row 0 (as fen_to_matrix).
+        '''
+        return self.values.reshape(8, 8).copy()
+
+    def model_inputs(self):
+        '''
+        Chess transformer inputs (as extract_model_inputs_from_fen).
+
+        :return: Tuple of (turn, white kingside, white queenside, black kingside, black queenside, board positions).
+        '''
+        board = self.board
+        return (int(board.turn),
+                int(board.has_kingside_castling_rights(chess.WHITE)), int(board.has_queenside_castling_rights(chess.WHITE)),
+                int(board.has_kingside_castling_rights(chess.BLACK)), int(board.has_queenside_castling_rights(chess.BLACK)),
+                np.abs(self.values).astype(np.int64).tolist())
+
+    def graph_arrays(self):
+        '''
+        Knowledge graph arrays (as build_graph_arrays), gathered from the maintained per-square state.
+
+        :return: Tuple of (x, edge_index, edge_attr).
+        '''
+        squares = np.flatnonzero(self.values)
+        n = len(squares)
+        if n not in self._pairs:
+            self._pairs[n] = np.triu_indices(n, k=1)
+        i, j = self._pairs[n]
+        edge_attr = self.interaction[squares[i], squares[j]].astype(np.float32)[:, None]
+        return self.node_features[squares], np.stack([i, j]).astype(np.int64), edge_attr
+
+
+# Replays a game with the incremental encoder, checking it against the from-scratch encoders and timing both.
+if __name__ == '__main__':
+
+    import os
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pgn_to_matrix'))
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mlp_for_stockfish_scores'))
+    from fen_batch_encoder import fens_to_matrices
+    from pgn_stream import iter_pgn_games, mainline_sans
+
+    pgn_file = '../pgn_to_matrix/lichess_LordJedizor_2024-12-26.pgn'
+    num_games = 50
+
+    incremental_time = scratch_time = 0.0
+    moves = 0
+    for _, headers, movetext in iter_pgn_games(pgn_file):
+        encoder = IncrementalBoardEncoder(headers.get('FEN'))
+        for san in mainline_sans(movetext):
+            start = time.perf_counter()
+            try:
+                encoder.push_san(san)
+            except ValueError:
+                break
+            matrix, graph = encoder.matrix(), encoder.graph_arrays()
+            incremental_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            fen = encoder.fen()
+            expected_matrix, expected_graph = fens_to_matrices([fen])[0], build_graph_arrays(fen)
+            scratch_time += time.perf_counter() - start
+
+            assert (matrix == expected_matrix).all(), fen
+            assert all((a == b).all() for a, b in zip(graph, expected_graph)), fen
+            moves += 1
+        num_games -= 1
+        if num_games == 0:
+            break
+
+    print(f'{moves} moves: incremental {incremental_time / moves * 1e6:.0f} us/move, '
+          f'from scratch {scratch_time / moves * 1e6:.0f} us/move')
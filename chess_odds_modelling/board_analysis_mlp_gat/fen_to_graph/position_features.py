@@ -0,0 +1,219 @@
+'''
+Precomputed per-position primitives, shared by the matrix encoder, the graph builder and the transformer
+input extractor, so python-chess only has to look at each position once.
+
+For every position, keyed by a 64-bit hash of its FEN (placement, side to move, castling, en passant):
+- pieces:    12 bitboards, one per piece, in the order P, N, B, R, Q, K, p, n, b, r, q, k
+- attacks:   64 bitboards, the squares attacked/defended by the piece on each square (0 if empty)
+- pinned:    bitboard of all pieces (either colour) pinned to their own king
+- mobility:  number of legal moves for the side to move
+- turn, castling (python-chess clean_castling_rights bitmask) and ep_square (-1 if none)
+
+A feature store is a directory of .npy shards of these records with an index.json, like the board datasets
+of mlp_for_stockfish_scores/board_dataset.py.
+'''
+
+import hashlib
+import json
+import os
+
+import chess
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+
+PIECE_ORDER = 'PNBRQKpnbrqk'
+
+FEATURE_DTYPE = np.dtype([
+    ('key', '<u8'),
+    ('pieces', '<u8', (12,)),
+    ('attacks', '<u8', (64,)),
+    ('pinned', '<u8'),
+    ('mobility', '<i2'),
+    ('turn', 'i1'),
+    ('castling', '<u8'),
+    ('ep_square', 'i1'),
+])
+
+
+def position_key(fen):
+    '''
+    Hashes the placement, side to move, castling and en passant fields of a FEN (move counters are ignored).
+
+    :return: Unsigned 64-bit integer key.
+    '''
+    normalised = ' '.join(fen.split()[:4])
+    return int.from_bytes(hashlib.blake2b(normalised.encode('ascii'), digest_size=8).digest(), 'little')
+
+
+def compute_position_features(fens):
+    '''
+    Computes the primitives of every FEN with python-chess.
+
+    :param fens: Sequence of FEN strings.
+    :return: Structured np.ndarray of FEATURE_DTYPE records, one per FEN.
+    '''
+    features = np.zeros(len(fens), dtype=FEATURE_DTYPE)
+    pieces, attacks = features['pieces'], features['attacks']
+
+    for i, fen in enumerate(fens):
+        board = chess.Board(fen)
+        features['key'][i] = position_key(fen)
+
+        for plane, symbol in enumerate(PIECE_ORDER):
+            piece = chess.Piece.from_symbol(symbol)
+            pieces[i, plane] = board.pieces_mask(piece.piece_type, piece.color)
+
+        pinned = 0
+        for square, piece in board.piece_map().items():
+            attacks[i, square] = board.attacks_mask(square)
+            if board.is_pinned(piece.color, square):
+                pinned |= chess.BB_SQUARES[square]
+        features['pinned'][i] = pinned
+
+        features['mobility'][i] = board.legal_moves.count()
+        features['turn'][i] = int(board.turn)
+        features['castling'][i] = board.clean_castling_rights()
+        features['ep_square'][i] = -1 if board.ep_square is None else board.ep_square
+
+    return features
+
+
+def bitboards_to_squares(bitboards):
+    '''
+    Unpacks uint64 bitboards into booleans per square, in python-chess square order (a1, b1, ..., h8).
+
+    :param bitboards: np.ndarray of uint64, any shape.
+    :return: np.ndarray of bool, with a trailing axis of 64 squares.
+    '''
+    bitboards = np.ascontiguousarray(bitboards, dtype='<u8')
+    bits = np.unpackbits(bitboards.view(np.uint8).reshape(*bitboards.shape, 8), axis=-1, bitorder='little')
+    return bits.reshape(*bitboards.shape, 64).astype(bool)
+
+
+def piece_list(features):
+    '''
+    Lists the pieces of one position, in ascending square order.
+
+    :param features: A single FEATURE_DTYPE record.
+    :return: Tuple of (squares, piece symbols), as an int64 array and a list of str.
+    '''
+    planes, squares = np.nonzero(bitboards_to_squares(features['pieces']))
+    order = np.argsort(squares)
+    return squares[order].astype(np.int64), [PIECE_ORDER[p] for p in planes[order]]
+
+
+class PositionFeatureStore:
+    '''
+    Persistent feature records, looked up by FEN. Shards are memory-mapped, and only the keys are held in memory.
+    '''
+
+    def __init__(self, path):
+        '''
+        :param path: Store directory (created if missing).
+        '''
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        index_file = os.path.join(path, 'index.json')
+        if os.path.exists(index_file):
+            with open(index_file, 'r') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'rows': 0, 'shards': []}
+
+        self.shards = [np.load(os.path.join(path, s['file']), mmap_mode='r') for s in self.index['shards']]
+        self._build_lookup()
+
+    def _build_lookup(self):
+        # Sorted keys, with the (shard, row) each one lives at.
+        keys = np.concatenate([s['key'] for s in self.shards]) if self.shards else np.empty(0, dtype='<u8')
+        shard_ids = np.concatenate([np.full(len(s), i) for i, s in enumerate(self.shards)]) if self.shards else np.empty(0, dtype=np.int64)
+        rows = np.concatenate([np.arange(len(s)) for s in self.shards]) if self.shards else np.empty(0, dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        self.keys, self.shard_ids, self.rows = keys[order], shard_ids[order], rows[order]
+
+    def __len__(self):
+        return self.index['rows']
+
+    def _find(self, keys):
+        # Position of every key in the sorted keys, and whether it is actually there.
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+        return pos, found
+
+    def add(self, fens):
+        '''
+        Computes and stores the features of every FEN not already in the store, as a new shard.
+
+        :return: Number of positions added.
+        '''
+        keys = np.array([position_key(fen) for fen in fens], dtype='<u8')
+        _, found = self._find(keys)
+        _, first = np.unique(keys, return_index=True)
+        new = np.zeros(len(fens), dtype=bool)
+        new[first] = True
+        new &= ~found
+        if not new.any():
+            return 0
+
+        features = compute_position_features([fen for fen, is_new in zip(fens, new) if is_new])
+        shard_file = f'features_{len(self.shards):05d}.npy'
+        np.save(os.path.join(self.path, shard_file), features)
+        self.index['shards'].append({'file': shard_file, 'rows': len(features)})
+        self.index['rows'] += len(features)
+
+        tmp_file = os.path.join(self.path, 'index.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_file, os.path.join(self.path, 'index.json'))
+
+        self.shards.append(np.load(os.path.join(self.path, shard_file), mmap_mode='r'))
+        self._build_lookup()
+        return len(features)
+
+    def lookup(self, fens, compute_missing=True):
+        '''
+        Reads the features of a batch of FENs.
+
+        :param fens: Sequence of FEN strings.
+        :param compute_missing: Whether to compute (without storing) positions missing from the store,
+                                rather than raising a KeyError.
+        :return: Structured np.ndarray of FEATURE_DTYPE records, one per FEN.
+        '''
+        keys = np.array([position_key(fen) for fen in fens], dtype='<u8')
+        pos, found = self._find(keys)
+        features = np.zeros(len(fens), dtype=FEATURE_DTYPE)
+
+        shard_ids = np.full(len(fens), -1)
+        rows = np.zeros(len(fens), dtype=np.int64)
+        shard_ids[found], rows[found] = self.shard_ids[pos[found]], self.rows[pos[found]]
+        for shard_id, shard in enumerate(self.shards):
+            hit = shard_ids == shard_id
+            if hit.any():
+                features[hit] = shard[rows[hit]]
+
+        if not found.all():
+            missing = np.flatnonzero(~found)
+            if not compute_missing:
+                raise KeyError(f'{len(missing)} positions missing from feature store {self.path}, e.g. {fens[missing[0]]}')
+            features[missing] = compute_position_features([fens[i] for i in missing])
+
+        return features
+
+
+# Precomputes the features of every position in the stockfish scores csv.
+if __name__ == '__main__':
+
+    filename = 'stockfish_scores_depth_20_interim.csv'
+    feature_store = 'position_features'
+    batch_size = 10000
+
+    FENs = list(pd.read_csv(filename)['FEN'])
+    store = PositionFeatureStore(feature_store)
+
+    print('Precomputing position features:')
+    for start in tqdm(range(0, len(FENs), batch_size)):
+        store.add(FENs[start:start + batch_size])
+    print(f'{len(store)} positions in {feature_store}')
@@ -4,9 +4,21 @@ from torch_geometric.nn import GATConv, global_mean_pool
 from torch_geometric.data import Data, DataLoader
 import networkx as nx
 import numpy as np
+import os
 import pickle
 from tqdm import tqdm
 
+from graph_datasets import CollatedGraphDataset
+
+# Sharded graph store written by FEN2Graph_v5.py (falls back to the networkx pickle if absent),
+# and the pre-collated, memory-mapped cache built from it on first use.
+graph_store = '../fen_to_graph/knowledge_graph_store'
+collated_cache = '../fen_to_graph/knowledge_graph_collated'
+
+# Trained model, with the hyperparameters needed to rebuild it (see load_gat_checkpoint).
+checkpoint = 'gat_checkpoint.pt'
+model_kwargs = {'input_dim': 5, 'hidden_dim': 16, 'edge_dim': 1, 'output_dim': 1}
+
 # Function to process a NetworkX graph into PyG Data format
 def process_nx_to_pyg(graph):
     # Extract node features
@@ -64,6 +76,15 @@ class GATRegressor(torch.nn.Module):
         x = self.fc(x)
         return x
 
+def load_gat_checkpoint(path):
+    '''
+    Rebuilds a GATRegressor saved by main(), in eval mode.
+    '''
+    saved = torch.load(path, map_location='cpu')
+    model = GATRegressor(**saved['model_kwargs'])
+    model.load_state_dict(saved['state_dict'])
+    return model.eval()
+
 # Main function
 def main():
     # Generate synthetic data
@@ -72,27 +93,41 @@ def main():
     nx_graphs = generate_dummy_graphs(num_graphs)
     '''
     
-    # Load graphs back
-    with open('../fen_to_graph/knowledge_graphs.pkl', 'rb') as f:
-        nx_graphs = pickle.load(f)
-    
-    nx_graphs = nx_graphs[:int(0.3*len(nx_graphs))]
-    num_graphs = len(nx_graphs)
-    print('Number of knowledge graphs:',num_graphs)  # List of graphs
-
-    # Process NetworkX graphs into PyG Data objects
-    pyg_data_list = [process_nx_to_pyg(g) for g in tqdm(nx_graphs)]
-
-    # Split data into train and test sets
-    train_data = pyg_data_list[:80]
-    test_data = pyg_data_list[80:]
-
-    # Create data loaders
-    train_loader = DataLoader(train_data, batch_size=16, shuffle=True)
-    test_loader = DataLoader(test_data, batch_size=16, shuffle=False)
+    if os.path.exists(graph_store):
+        # All graphs as a few big memory-mapped arrays; batches are gathered from them directly.
+        dataset = CollatedGraphDataset(collated_cache, source=graph_store)
+        indices = np.arange(int(0.3*len(dataset)))
+        print('Number of knowledge graphs:',len(indices))
+
+        # Split data into train and test sets
+        train_data = indices[:80]
+        test_data = indices[80:]
+
+        # Create data loaders
+        train_loader = dataset.loader(train_data, batch_size=16, shuffle=True)
+        test_loader = dataset.loader(test_data, batch_size=16, shuffle=False)
+    else:
+        # Load graphs back
+        with open('../fen_to_graph/knowledge_graphs.pkl', 'rb') as f:
+            nx_graphs = pickle.load(f)
+
+        nx_graphs = nx_graphs[:int(0.3*len(nx_graphs))]
+        num_graphs = len(nx_graphs)
+        print('Number of knowledge graphs:',num_graphs)  # List of graphs
+
+        # Process NetworkX graphs into PyG Data objects
+        pyg_data_list = [process_nx_to_pyg(g) for g in tqdm(nx_graphs)]
+
+        # Split data into train and test sets
+        train_data = pyg_data_list[:80]
+        test_data = pyg_data_list[80:]
+
+        # Create data loaders
+        train_loader = DataLoader(train_data, batch_size=16, shuffle=True)
+        test_loader = DataLoader(test_data, batch_size=16, shuffle=False)
 
     # Model, optimizer, and loss function
-    model = GATRegressor(input_dim=5, hidden_dim=16, edge_dim=1, output_dim=1)
+    model = GATRegressor(**model_kwargs)
     optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
     loss_fn = torch.nn.MSELoss()
 
@@ -119,5 +154,8 @@ def main():
             total_loss += loss.item() * batch.num_graphs
     print(f"Test Loss: {total_loss / len(test_data):.4f}")
 
+    torch.save({'model_kwargs': model_kwargs, 'state_dict': model.state_dict()}, checkpoint)
+    print(f"Saved model to {checkpoint}")
+
 if __name__ == "__main__":
     main()
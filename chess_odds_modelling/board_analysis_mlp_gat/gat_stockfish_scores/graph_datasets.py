@@ -0,0 +1,117 @@
+'''
+PyG datasets over the knowledge graphs written by FEN2Graph (see fen_to_graph/graph_store.py).
+'''
+
+import os
+import sys
+
+import numpy as np
+import torch
+from torch_geometric.data import Batch, Data, Dataset
+
+# The graph store lives alongside the FEN to graph scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fen_to_graph'))
+from graph_store import GraphStore, GraphStoreWriter, gather_graphs, merge_shards
+
+
+class GraphStoreDataset(Dataset):
+    '''
+    Lazily reads graphs from a sharded graph store, one Data object per position.
+    '''
+
+    def __init__(self, path, transform=None):
+        '''
+        :param path: Graph store directory.
+        :param transform: Optional PyG transform, applied on access.
+        '''
+        self.store = GraphStore(path)
+        super().__init__(None, transform)
+
+    def len(self):
+        return len(self.store)
+
+    def get(self, idx):
+        graph = self.store[idx]
+        return Data(x=torch.from_numpy(graph['x']),
+                    edge_index=torch.from_numpy(graph['edge_index']),
+                    edge_attr=torch.from_numpy(graph['edge_attr']),
+                    y=torch.tensor([graph['y']], dtype=torch.float))
+
+
+class CollatedGraphDataset(Dataset):
+    '''
+    Every graph pre-collated into one node-feature array, one edge-index array and one edge-feature array,
+    with per-graph slice pointers, in the style of PyG's InMemoryDataset.
+
+    The collated arrays are built once into a cache directory (a single-shard graph store) and memory-mapped
+    on later runs. Its loader gathers mini-batches straight from them, without a Data object per graph.
+    '''
+
+    def __init__(self, cache_path, source=None, transform=None):
+        '''
+        :param cache_path: Directory of the collated cache.
+        :param source: Graph store directory to build the cache from, when the cache is missing or older than the store.
+        :param transform: Optional PyG transform, applied to single graphs on access.
+        '''
+        index_file = os.path.join(cache_path, 'index.json')
+        if source is not None and (not os.path.exists(index_file) or os.path.getmtime(os.path.join(source, 'index.json')) > os.path.getmtime(index_file)):
+            build_collated_cache(source, cache_path)
+
+        store = GraphStore(cache_path)
+        if len(store.index['shards']) > 1:
+            raise ValueError(f'{cache_path} is not a collated cache (it has more than one shard).')
+        self.arrays = store.shard(0) if len(store) else None
+        self.num_graphs = len(store)
+        super().__init__(None, transform)
+
+    def len(self):
+        return self.num_graphs
+
+    def get(self, idx):
+        graph = gather_graphs(self.arrays, [idx])
+        return Data(x=torch.from_numpy(graph['x']),
+                    edge_index=torch.from_numpy(graph['edge_index']),
+                    edge_attr=torch.from_numpy(graph['edge_attr']),
+                    y=torch.from_numpy(graph['y']))
+
+    def collate(self, indices):
+        '''
+        Builds the PyG Batch of the given graphs directly from the collated arrays.
+        '''
+        graphs = gather_graphs(self.arrays, indices)
+        return Batch(**{key: torch.from_numpy(value) for key, value in graphs.items()})
+
+    def loader(self, indices=None, batch_size=16, shuffle=False):
+        '''
+        Returns a re-iterable of mini-batches of the given graphs (all by default), for use in place of a PyG DataLoader.
+        '''
+        return CollatedLoader(self, indices, batch_size, shuffle)
+
+
+class CollatedLoader:
+    '''
+    Yields PyG Batch objects gathered from a CollatedGraphDataset, reshuffling (if asked) on every pass.
+    '''
+
+    def __init__(self, dataset, indices=None, batch_size=16, shuffle=False):
+        self.dataset = dataset
+        self.indices = np.arange(len(dataset)) if indices is None else np.asarray(indices)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+
+    def __len__(self):
+        return -(-len(self.indices) // self.batch_size)
+
+    def __iter__(self):
+        indices = np.random.permutation(self.indices) if self.shuffle else self.indices
+        for start in range(0, len(indices), self.batch_size):
+            yield self.dataset.collate(indices[start:start + self.batch_size])
+
+
+def build_collated_cache(source, cache_path):
+    '''
+    Collates every graph of a graph store into a single-shard graph store at cache_path.
+    '''
+    store = GraphStore(source)
+    collated = merge_shards([store.shard(i) for i in range(len(store.index['shards']))])
+    GraphStoreWriter(cache_path, source=source).write_shard(collated)
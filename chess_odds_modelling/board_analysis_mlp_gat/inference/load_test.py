@@ -0,0 +1,128 @@
+'''
+Load test for score_server.py: concurrent clients, each on its own keep-alive connection, send /score requests of
+FENs sampled from a scores csv (or replay games through /games), and the latency distribution is reported.
+
+Usage (with the server running):
+    python load_test.py --concurrency 8 --requests 2000 --fens-per-request 1
+    python load_test.py --mode games --pgn ../pgn_to_matrix/lichess_LordJedizor_2024-12-26.pgn
+'''
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pgn_to_matrix'))
+from pgn_stream import iter_pgn_games, mainline_sans
+
+
+class Client:
+    '''
+    JSON client over one persistent HTTP connection.
+    '''
+
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port)
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        self.connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = self.connection.getresponse()
+        result = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(f'{method} {path} failed ({response.status}): {result.get("error")}')
+        return result
+
+    def close(self):
+        self.connection.close()
+
+
+def score_worker(host, port, fens, num_requests, fens_per_request, seed, latencies, errors):
+    client = Client(host, port)
+    rng = np.random.default_rng(seed)
+    for _ in range(num_requests):
+        batch = [fens[i] for i in rng.integers(len(fens), size=fens_per_request)]
+        start = time.perf_counter()
+        try:
+            client.request('POST', '/score', {'fens': batch})
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(str(e))
+    client.close()
+
+
+def game_worker(host, port, games, worker_idx, latencies, errors):
+    # Replays each game one move per request, as a live feed would.
+    client = Client(host, port)
+    for game_idx, (headers, sans) in enumerate(games):
+        game_id = f'load-test-{worker_idx}-{game_idx}'
+        client.request('POST', f'/games/{game_id}', {'fen': headers.get('FEN'), 'reset': True})
+        for san in sans:
+            start = time.perf_counter()
+            try:
+                client.request('POST', f'/games/{game_id}', {'moves': [san]})
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(str(e))
+                break
+        client.request('DELETE', f'/games/{game_id}')
+    client.close()
+
+
+def report(latencies, errors, elapsed, positions_per_request=None):
+    latencies_ms = np.array(latencies) * 1000
+    print(f'{len(latencies)} requests in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} requests/s'
+          + (f', {len(latencies) * positions_per_request / elapsed:.0f} positions/s)' if positions_per_request else ')'))
+    if len(latencies_ms):
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+        print(f'Latency: mean {latencies_ms.mean():.2f} ms, p50 {p50:.2f} ms, p95 {p95:.2f} ms, '
+              f'p99 {p99:.2f} ms, max {latencies_ms.max():.2f} ms')
+    if errors:
+        print(f'{len(errors)} errors, e.g. {errors[0]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for the local scoring service.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--mode', choices=['score', 'games'], default='score')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients.')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per client (score mode).')
+    parser.add_argument('--fens-per-request', type=int, default=1)
+    parser.add_argument('--fens-file', default='../mlp_for_stockfish_scores/stockfish_scores_depth_20_interim.csv')
+    parser.add_argument('--pgn', default='../pgn_to_matrix/lichess_LordJedizor_2024-12-26.pgn')
+    parser.add_argument('--games', type=int, default=8, help='Games per client (games mode).')
+    args = parser.parse_args()
+
+    latencies, errors, threads = [], [], []
+    if args.mode == 'score':
+        fens = list(pd.read_csv(args.fens_file)['FEN'])
+        for i in range(args.concurrency):
+            threads.append(threading.Thread(target=score_worker, args=(
+                args.host, args.port, fens, args.requests, args.fens_per_request, i, latencies, errors)))
+    else:
+        games = []
+        for _, headers, movetext in iter_pgn_games(args.pgn):
+            games.append((headers, mainline_sans(movetext)))
+            if len(games) == args.concurrency * args.games:
+                break
+        for i in range(args.concurrency):
+            threads.append(threading.Thread(target=game_worker, args=(
+                args.host, args.port, games[i::args.concurrency], i, latencies, errors)))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(latencies, errors, time.perf_counter() - start, args.fens_per_request if args.mode == 'score' else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+'''
+Local, evaluation-only scoring service for the trained chess models (the MLP of mlp_for_stockfish_scores/mlp_trainer.py
+or the GATRegressor of gat_stockfish_scores/gat_v1.py), for live-game odds.
+
+The checkpoint is loaded once at start-up. Concurrent requests are micro-batched: the first waiting request
+opens a batch, which is closed after max_wait_ms or once max_batch_size positions have arrived, and scored
+with a single forward pass.
+
+JSON over HTTP (keep-alive), on localhost by default:
+
+    POST /score              {"fens": [...]}                                   -> {"scores": [...]}
+    POST /games/<game_id>    {"moves": [...], "fen": ..., "pgn": ..., "reset": false}
+                                                                               -> {"fens": [...], "scores": [...]}
+    DELETE /games/<game_id>                                                    -> {}
+    GET /health                                                                -> {"model": ..., "pending": ...}
+
+/games follows a live game move by move: moves (SAN or UCI) are played on the game's board, and the position
+after each one is scored. A new (or reset) game starts from fen if given, else the standard position, and is
+first advanced through the mainline of pgn (movetext) if given. A list with an illegal move is rejected as a
+whole (400), leaving the game's board unchanged.
+
+A request whose positions are not scored within --score-timeout seconds gets a 503 (with the FENs, for /games,
+whose moves were played).
+
+Usage:
+    python score_server.py --model mlp --checkpoint ../mlp_for_stockfish_scores/mlp_checkpoint.pt
+    python score_server.py --model gat --checkpoint ../gat_stockfish_scores/gat_checkpoint.pt
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+
+import chess
+import numpy as np
+import torch
+
+# The models, encoders and PGN parsing live alongside the training scripts.
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for _folder in ('mlp_for_stockfish_scores', 'gat_stockfish_scores', 'fen_to_graph', 'pgn_to_matrix'):
+    sys.path.append(os.path.join(_ROOT, _folder))
+from fen_batch_encoder import fens_to_matrices
+from graph_builder import build_graph_arrays
+from graph_store import concatenate_graphs, gather_graphs
+from pgn_stream import mainline_sans
+
+
+class MLPScorer:
+    '''
+    Scores batches of FENs with an MLP checkpoint (64 signed piece values per board, as FEN2matrix.py encodes them).
+    '''
+
+    name = 'mlp'
+
+    def __init__(self, checkpoint):
+        from mlp_trainer import load_checkpoint, to_tensor
+        self.model = load_checkpoint(checkpoint)
+        self.to_tensor = to_tensor
+
+    def __call__(self, fens):
+        with torch.inference_mode():
+            return self.model(self.to_tensor(fens_to_matrices(fens).reshape(len(fens), 64))).numpy()
+
+
+class GATScorer:
+    '''
+    Scores batches of FENs with a GATRegressor checkpoint, on graphs from graph_builder.build_graph_arrays.
+    '''
+
+    name = 'gat'
+
+    def __init__(self, checkpoint):
+        from gat_v1 import load_gat_checkpoint
+        from torch_geometric.data import Batch
+        self.model = load_gat_checkpoint(checkpoint)
+        self.Batch = Batch
+
+    def __call__(self, fens):
+        graphs = [build_graph_arrays(fen) for fen in fens]
+        shard = concatenate_graphs(*zip(*graphs), [None] * len(fens))
+        batch = gather_graphs(shard, np.arange(len(fens)))
+        with torch.inference_mode():
+            out = self.model(self.Batch(**{key: torch.from_numpy(value) for key, value in batch.items()}))
+        return out.reshape(-1).numpy()
+
+
+SCORERS = {'mlp': MLPScorer, 'gat': GATScorer}
+
+
+class MicroBatcher:
+    '''
+    Collects FENs from concurrent callers into batches, scored one batch at a time on a single worker thread.
+    '''
+
+    def __init__(self, scorer, max_batch_size=64, max_wait_ms=2.0):
+        '''
+        :param scorer: Function of a list of FENs, returning an array of scores.
+        :param max_batch_size: Most positions per forward pass (a single larger request is still scored in one pass).
+        :param max_wait_ms: Longest a request waits for others to join its batch.
+        '''
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, fens):
+        '''
+        Queues a list of FENs for scoring.
+
+        :return: concurrent.futures.Future resolving to a list of floats, one per FEN.
+        '''
+        future = Future()
+        if not fens:
+            future.set_result([])
+        else:
+            self.requests.put((list(fens), future))
+        return future
+
+    def score(self, fens, timeout=None):
+        return self.submit(fens).result(timeout)
+
+    def pending(self):
+        return self.requests.qsize()
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            fens = [fen for request_fens, _ in batch for fen in request_fens]
+            try:
+                scores = np.asarray(self.scorer(fens), dtype=np.float64).tolist()
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request_fens, future in batch:
+                future.set_result(scores[start:start + len(request_fens)])
+                start += len(request_fens)
+
+
+class LiveGame:
+    '''
+    Board of a game being followed move by move.
+    '''
+
+    def __init__(self, fen=None, pgn=None):
+        self.board = chess.Board(fen) if fen else chess.Board()
+        self.lock = threading.Lock()
+        if pgn:
+            self.play(mainline_sans(pgn))
+
+    def play(self, moves):
+        '''
+        Plays moves given in SAN or UCI, all or none: they are checked on a copy of the board, which only
+        replaces the game's board once every move has been played.
+
+        :return: List of the FENs after each move.
+        :raises ValueError: On an illegal or unreadable move (the game's board is left unchanged).
+        '''
+        board = self.board.copy()
+        fens = []
+        for move in moves:
+            try:
+                board.push_san(move)
+            except ValueError:
+                try:
+                    board.push_uci(move)
+                except ValueError:
+                    raise ValueError(f'Illegal or unreadable move {move!r} in position {board.fen()} '
+                                     f'(no moves were played)')
+            fens.append(board.fen())
+        self.board = board
+        return fens
+
+
+def validate_fens(fens):
+    '''
+    Checks the request FENs parse, so that one bad FEN cannot fail the whole micro-batch it would land in.
+    '''
+    if not isinstance(fens, list) or not all(isinstance(fen, str) for fen in fens):
+        raise ValueError('"fens" must be a list of FEN strings.')
+    for fen in fens:
+        chess.Board(fen)
+
+
+class ScoreRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without TCP_NODELAY the body waits on the client's delayed ACK (~40 ms).
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'model': self.server.scorer_name, 'pending': self.server.batcher.pending(),
+                             'games': len(self.server.games)})
+        else:
+            self._send(404, {'error': f'Unknown path {self.path}'})
+
+    def _score(self, fens):
+        return self.server.batcher.score(fens, timeout=self.server.score_timeout)
+
+    def do_POST(self):
+        fens = None
+        try:
+            request = self._read_json()
+            if self.path == '/score':
+                fens = request.get('fens')
+                validate_fens(fens)
+                self._send(200, {'scores': self._score(fens)})
+            elif self.path.startswith('/games/'):
+                game = self.server.get_game(self.path[len('/games/'):], request)
+                with game.lock:
+                    fens = game.play(request.get('moves', []))
+                self._send(200, {'fens': fens, 'scores': self._score(fens)})
+            else:
+                self._send(404, {'error': f'Unknown path {self.path}'})
+        except TimeoutError:
+            payload = {'error': f'Scoring timed out after {self.server.score_timeout} s'}
+            if self.path.startswith('/games/'):
+                payload['fens'] = fens  # The moves were played; only their scores are missing.
+            self._send(503, payload)
+        except ValueError as e:  # Includes malformed JSON, FENs and moves.
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            self._send(500, {'error': f'{type(e).__name__}: {e}'})
+
+    def do_DELETE(self):
+        if self.path.startswith('/games/'):
+            with self.server.games_lock:
+                self.server.games.pop(self.path[len('/games/'):], None)
+            self._send(200, {})
+        else:
+            self._send(404, {'error': f'Unknown path {self.path}'})
+
+
+class ScoreServer(ThreadingHTTPServer):
+    '''
+    HTTP front end of a MicroBatcher, with the boards of the live games being followed.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address, batcher, scorer_name, score_timeout=10.0):
+        '''
+        :param score_timeout: Seconds a request waits for its scores before getting a 503.
+        '''
+        super().__init__(address, ScoreRequestHandler)
+        self.batcher = batcher
+        self.scorer_name = scorer_name
+        self.score_timeout = score_timeout
+        self.games = {}
+        self.games_lock = threading.Lock()
+
+    def get_game(self, game_id, request):
+        '''
+        Returns the game's board, (re)starting it if it is new or the request asks for a reset.
+        '''
+        with self.games_lock:
+            if game_id not in self.games or request.get('reset'):
+                self.games[game_id] = LiveGame(request.get('fen'), request.get('pgn'))
+            return self.games[game_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local micro-batching scoring service for the chess models.')
+    parser.add_argument('--model', choices=sorted(SCORERS), default='mlp')
+    parser.add_argument('--checkpoint', required=True, help='Checkpoint saved by mlp_trainer.py or gat_v1.py.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--score-timeout', type=float, default=10.0, help='Seconds before a request gets a 503.')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads (defaults to the number of cores).')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads or os.cpu_count())
+    scorer = SCORERS[args.model](args.checkpoint)
+    scorer([chess.STARTING_FEN])  # Warm-up, so the first request does not pay for lazy initialisation.
+
+    batcher = MicroBatcher(scorer, args.max_batch_size, args.max_wait_ms)
+    server = ScoreServer((args.host, args.port), batcher, scorer.name, args.score_timeout)
+    print(f'Serving {args.model} scores from {args.checkpoint} on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
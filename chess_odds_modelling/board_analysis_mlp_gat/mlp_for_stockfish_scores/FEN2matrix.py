@@ -1,8 +1,16 @@
+import os
+import sys
+
 import pandas as pd
-import numpy as np
-import chess
 from tqdm import tqdm
 
+from board_dataset import BoardDatasetWriter
+from fen_batch_encoder import bitboards_to_matrices, fens_to_matrices, iter_encoded_batches
+
+# Precomputed position features live alongside the FEN to graph scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fen_to_graph'))
+from position_features import PositionFeatureStore
+
 
 filename = 'stockfish_scores_depth_20_interim.csv'
 df = pd.read_csv(filename)
@@ -10,54 +18,36 @@ df = pd.read_csv(filename)
 
 def fen_to_matrix(fen):
     '''
-    Converts a FEN string to an 8x8 matrix using python-chess.
+    Converts a FEN string to an 8x8 matrix (single-position wrapper around fens_to_matrices).
 
     Args:
         fen (str): The FEN string of the chess position.
 
     Returns:
-        np.ndarray: An 8x8 numpy array representing the board.
+        np.ndarray: An 8x8 numpy array representing the board (rank 1 in row 0).
     '''
-    # Mapping pieces to numbers
-    piece_map = {
-        'P': 1, 'N': 2, 'B': 3, 'R': 4, 'Q': 5, 'K': 6,  # White pieces
-        'p': -1, 'n': -2, 'b': -3, 'r': -4, 'q': -5, 'k': -6  # Black pieces
-    }
-
-    # Initialize a chess board from the FEN string
-    board = chess.Board(fen)
-
-    # Initialize an empty 8x8 matrix
-    board_matrix = np.zeros((8, 8), dtype=int)
-
-    # Loop through squares and populate the matrix
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            row, col = divmod(square, 8)
-            board_matrix[row, col] = piece_map[piece.symbol()]
-
-    return board_matrix
+    return fens_to_matrices([fen])[0]
 
 # Example usage
 if __name__ == '__main__':
     
-    output_file = 'interim_dataset.csv'
-    with open(output_file, 'w') as f:
-        for n in range(64):
-            f.write(f'x{n},')
-        f.write('y')
-    
-    for fen, score in tqdm(zip(list(df['FEN']), list(df['stockfish_score'])), total=len(list(df['FEN']))):
-        
-        board_matrix = fen_to_matrix(fen)
-        board_vector = board_matrix.flatten()
-        
-        with open(output_file, 'a') as f:
-            f.write('\n')
-            for i in board_vector:
-                f.write(f'{i},')
-            f.write(str(score))
-        
-
-
+    # Binary dataset directory (int8 boards, float32 scores), replacing interim_dataset.csv.
+    output_dir = 'interim_dataset'
+
+    FENs = list(df['FEN'])
+    scores = df['stockfish_score'].to_numpy()
+    batch_size = 100_000
+
+    # Optional precomputed position features (see position_features.py), encoded from instead of the FENs.
+    feature_store = None
+
+    if feature_store is not None:
+        store = PositionFeatureStore(feature_store)
+        encoder = lambda fens: bitboards_to_matrices(store.lookup(fens)['pieces'])
+    else:
+        encoder = fens_to_matrices
+
+    # Encodes whole batches of FENs at once, straight into the dataset shards.
+    with BoardDatasetWriter(output_dir, feature_shape=(64,)) as writer:
+        for start, board_matrices in tqdm(iter_encoded_batches(FENs, batch_size, encoder), total=-(-len(FENs) // batch_size)):
+            writer.append_batch(board_matrices.reshape(-1, 64), scores[start:start + len(board_matrices)])
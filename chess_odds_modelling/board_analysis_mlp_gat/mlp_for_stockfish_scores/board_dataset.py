@@ -0,0 +1,151 @@
+'''
+Compact binary dataset of encoded boards and their Stockfish targets.
+
+A dataset is a directory holding int8 feature shards (X_00000.npy, ...), float32 target shards
+(y_00000.npy, ...) and an index.json describing them. Shards are plain .npy files, so they can be
+memory-mapped straight back in without parsing.
+'''
+
+import json
+import os
+
+import numpy as np
+
+
+class BoardDatasetWriter:
+    '''
+    Buffers encoded boards in memory and writes them out as fixed-size .npy shards.
+    '''
+
+    def __init__(self, path, feature_shape=(64,), shard_size=1_000_000):
+        '''
+        :param path: Dataset directory (created if missing; existing shards are replaced).
+        :param feature_shape: Shape of a single encoded board, e.g. (64,) or (12, 64).
+        :param shard_size: Number of rows per shard.
+        '''
+        self.path = path
+        self.feature_shape = tuple(feature_shape)
+        self.shard_size = shard_size
+        self.shards = []
+        self.rows = 0
+
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith('.npy') or name == 'index.json':
+                os.remove(os.path.join(path, name))
+
+        self._new_buffer()
+
+    def _new_buffer(self):
+        self.X_buffer = np.empty((self.shard_size, *self.feature_shape), dtype=np.int8)
+        self.y_buffer = np.empty(self.shard_size, dtype=np.float32)
+        self.filled = 0
+
+    def append(self, x, y):
+        '''
+        Adds a single encoded board and its target.
+        '''
+        self.X_buffer[self.filled] = np.asarray(x).reshape(self.feature_shape)
+        self.y_buffer[self.filled] = y
+        self.filled += 1
+        if self.filled == self.shard_size:
+            self.flush()
+
+    def append_batch(self, X, y):
+        '''
+        Adds a batch of encoded boards, of shape (N, *feature_shape), and their N targets.
+        '''
+        X = np.asarray(X).reshape(-1, *self.feature_shape)
+        y = np.asarray(y)
+        start = 0
+        while start < len(X):
+            take = min(self.shard_size - self.filled, len(X) - start)
+            self.X_buffer[self.filled:self.filled + take] = X[start:start + take]
+            self.y_buffer[self.filled:self.filled + take] = y[start:start + take]
+            self.filled += take
+            start += take
+            if self.filled == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        '''
+        Writes the buffered rows as a new shard.
+        '''
+        if self.filled == 0:
+            return
+        shard_idx = len(self.shards)
+        X_file, y_file = f'X_{shard_idx:05d}.npy', f'y_{shard_idx:05d}.npy'
+        np.save(os.path.join(self.path, X_file), self.X_buffer[:self.filled])
+        np.save(os.path.join(self.path, y_file), self.y_buffer[:self.filled])
+        self.shards.append({'X': X_file, 'y': y_file, 'rows': self.filled})
+        self.rows += self.filled
+        self._new_buffer()
+
+    def close(self):
+        '''
+        Writes any remaining rows, then the index (last, so a complete index means a complete dataset).
+        '''
+        self.flush()
+        index = {'rows': self.rows, 'feature_shape': list(self.feature_shape),
+                 'X_dtype': 'int8', 'y_dtype': 'float32', 'shards': self.shards}
+        tmp_file = os.path.join(self.path, 'index.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_file, os.path.join(self.path, 'index.json'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BoardDataset:
+    '''
+    Read-only view over a dataset directory, with every shard memory-mapped.
+    '''
+
+    def __init__(self, path, mmap=True):
+        '''
+        :param path: Dataset directory written by BoardDatasetWriter.
+        :param mmap: Whether to memory-map the shards (zero-copy) rather than read them into memory.
+        '''
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            self.index = json.load(f)
+
+        mmap_mode = 'r' if mmap else None
+        self.X_shards = [np.load(os.path.join(path, s['X']), mmap_mode=mmap_mode) for s in self.index['shards']]
+        self.y_shards = [np.load(os.path.join(path, s['y']), mmap_mode=mmap_mode) for s in self.index['shards']]
+        self.offsets = np.cumsum([0] + [s['rows'] for s in self.index['shards']])
+
+    def __len__(self):
+        return self.index['rows']
+
+    def __getitem__(self, idx):
+        '''
+        Returns (x, y) for a single row.
+        '''
+        if idx < 0:
+            idx += len(self)
+        shard = int(np.searchsorted(self.offsets, idx, side='right')) - 1
+        local = idx - self.offsets[shard]
+        return self.X_shards[shard][local], self.y_shards[shard][local]
+
+    def arrays(self):
+        '''
+        Returns the whole dataset as (X, y). With a single shard these are the memory-maps themselves
+        (no copy); with several, the shards are concatenated.
+        '''
+        if len(self.X_shards) == 1:
+            return self.X_shards[0], self.y_shards[0]
+        if not self.X_shards:
+            shape = tuple(self.index['feature_shape'])
+            return np.empty((0, *shape), dtype=np.int8), np.empty(0, dtype=np.float32)
+        return np.concatenate(self.X_shards), np.concatenate(self.y_shards)
+
+
+def load_board_dataset(path, mmap=True):
+    '''
+    Loads a dataset directory as (X, y) arrays (see BoardDataset.arrays).
+    '''
+    return BoardDataset(path, mmap).arrays()
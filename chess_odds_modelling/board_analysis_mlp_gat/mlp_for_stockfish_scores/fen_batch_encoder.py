@@ -0,0 +1,127 @@
+'''
+Vectorised FEN encoders: whole batches of FENs are turned into int8 arrays with NumPy lookup tables,
+without building a chess.Board per position.
+'''
+
+import numpy as np
+
+
+# Expands run-length digits to empty squares ('.') and drops rank separators, so every placement
+# field becomes exactly 64 characters, in FEN order (a8, b8, ..., h1).
+_EXPAND_PLACEMENT = str.maketrans({str(n): '.' * n for n in range(1, 9)} | {'/': None})
+
+# Signed piece values, as in fen_to_matrix (white positive, black negative).
+MATRIX_LUT = np.zeros(256, dtype=np.int8)
+for symbol, value in {'P': 1, 'N': 2, 'B': 3, 'R': 4, 'Q': 5, 'K': 6}.items():
+    MATRIX_LUT[ord(symbol)] = value
+    MATRIX_LUT[ord(symbol.lower())] = -value
+
+# One-hot plane index per piece: white P, N, B, R, Q, K, then black p, n, b, r, q, k (-1 = empty).
+PLANE_SYMBOLS = 'PNBRQKpnbrqk'
+PLANE_LUT = np.full(256, -1, dtype=np.int8)
+for plane, symbol in enumerate(PLANE_SYMBOLS):
+    PLANE_LUT[ord(symbol)] = plane
+
+# Signed piece values in plane order, for encoding from piece bitboards.
+PLANE_VALUES = MATRIX_LUT[np.frombuffer(PLANE_SYMBOLS.encode('ascii'), dtype=np.uint8)]
+
+# Reorders FEN-order squares (a8 first) into python-chess square order (a1 first).
+_FEN_TO_SQUARE_ORDER = np.arange(64).reshape(8, 8)[::-1].flatten()
+
+
+def placement_codes(fens, rank_order='a1'):
+    '''
+    Parses the placement field of N FENs into an (N, 64) array of ASCII codes.
+
+    :param fens: Sequence of FEN strings (full FENs or placement fields only).
+    :param rank_order: 'a1' for python-chess square order (a1, b1, ..., h8), or 'a8' for FEN/display order.
+    :return: np.ndarray of shape (N, 64), dtype uint8.
+    '''
+    expanded = ''.join(fen.split(' ', 1)[0].translate(_EXPAND_PLACEMENT) for fen in fens)
+    codes = np.frombuffer(expanded.encode('ascii'), dtype=np.uint8)
+    if codes.size != 64 * len(fens):
+        raise ValueError('Malformed FEN placement field in batch.')
+    codes = codes.reshape(len(fens), 64)
+    if rank_order == 'a1':
+        codes = codes[:, _FEN_TO_SQUARE_ORDER]
+    return codes
+
+
+def fens_to_matrices(fens, rank_order='a1'):
+    '''
+    Encodes N FENs as signed 8x8 piece matrices (P=1 ... K=6, black negative), as fen_to_matrix does.
+
+    :param fens: Sequence of FEN strings.
+    :param rank_order: 'a1' puts rank 1 in row 0 (as fen_to_matrix), 'a8' puts rank 8 in row 0 (as board_to_matrix).
+    :return: np.ndarray of shape (N, 8, 8), dtype int8.
+    '''
+    return MATRIX_LUT[placement_codes(fens, rank_order)].reshape(len(fens), 8, 8)
+
+
+def bitboards_to_matrices(pieces, rank_order='a1'):
+    '''
+    Encodes N positions given as 12 piece bitboards (in PLANE_SYMBOLS order, as the pieces field of
+    fen_to_graph/position_features.py) as signed 8x8 piece matrices, as fens_to_matrices does.
+
+    :param pieces: np.ndarray of shape (N, 12), dtype uint64.
+    :param rank_order: 'a1' or 'a8' (see fens_to_matrices).
+    :return: np.ndarray of shape (N, 8, 8), dtype int8.
+    '''
+    pieces = np.ascontiguousarray(pieces, dtype='<u8')
+    n = len(pieces)
+    occupied = np.unpackbits(pieces.view(np.uint8).reshape(n, 12, 8), axis=-1, bitorder='little').reshape(n, 12, 64)
+    matrices = np.einsum('p,nps->ns', PLANE_VALUES.astype(np.int16), occupied.astype(np.int16)).astype(np.int8)
+    if rank_order == 'a8':
+        # The a1/a8 reordering is a rank flip, so it is its own inverse.
+        matrices = matrices[:, _FEN_TO_SQUARE_ORDER]
+    return matrices.reshape(n, 8, 8)
+
+
+def fens_to_planes(fens, side_to_move=False, castling=False, en_passant=False, rank_order='a1'):
+    '''
+    Encodes N FENs as one-hot piece planes, optionally followed by game-state planes.
+
+    :param fens: Sequence of FEN strings.
+    :param side_to_move: Adds a plane of ones when White is to move.
+    :param castling: Adds four planes of ones for K, Q, k and q castling rights, in that order.
+    :param en_passant: Adds a plane with a one on the en passant target square, if any.
+    :param rank_order: Square order within each plane ('a1' or 'a8', see placement_codes).
+    :return: np.ndarray of shape (N, 12 + extra planes, 64), dtype int8.
+    '''
+    n = len(fens)
+    piece_planes = PLANE_LUT[placement_codes(fens, rank_order)]
+    num_extra = int(side_to_move) + 4 * int(castling) + int(en_passant)
+    planes = np.zeros((n, 12 + num_extra, 64), dtype=np.int8)
+
+    # Scatters a one into the piece's plane for every occupied square.
+    rows, squares = np.nonzero(piece_planes >= 0)
+    planes[rows, piece_planes[rows, squares], squares] = 1
+
+    if num_extra:
+        fields = [fen.split() for fen in fens]
+        plane = 12
+        if side_to_move:
+            planes[:, plane] = np.array([f[1] == 'w' for f in fields], dtype=np.int8)[:, None]
+            plane += 1
+        if castling:
+            for right in 'KQkq':
+                planes[:, plane] = np.array([right in f[2] for f in fields], dtype=np.int8)[:, None]
+                plane += 1
+        if en_passant:
+            for row, f in enumerate(fields):
+                if f[3] != '-':
+                    file, rank = ord(f[3][0]) - ord('a'), int(f[3][1]) - 1
+                    square = rank * 8 + file if rank_order == 'a1' else (7 - rank) * 8 + file
+                    planes[row, plane, square] = 1
+
+    return planes
+
+
+def iter_encoded_batches(fens, batch_size=100_000, encoder=fens_to_matrices, **kwargs):
+    '''
+    Encodes a long list of FENs in fixed-size batches, to bound peak memory.
+
+    :return: Generator of (start index, encoded batch) tuples.
+    '''
+    for start in range(0, len(fens), batch_size):
+        yield start, encoder(fens[start:start + batch_size], **kwargs)
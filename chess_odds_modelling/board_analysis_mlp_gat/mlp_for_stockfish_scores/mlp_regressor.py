@@ -1,4 +1,3 @@
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.neural_network import MLPRegressor
 from sklearn.metrics import r2_score
@@ -7,14 +6,24 @@ import matplotlib.pyplot as plt
 import warnings
 from sklearn.exceptions import ConvergenceWarning
 
+from board_dataset import load_board_dataset
+from transposition_index import TranspositionIndex
+
 warnings.filterwarnings('ignore', category=ConvergenceWarning)
 
-# Load data from CSV file
-data = pd.read_csv('interim_dataset.csv')  # Replace 'data.csv' with your file name
+# Load data from the binary dataset written by FEN2matrix.py (memory-mapped, no parsing)
+X, y = load_board_dataset('interim_dataset')
 
-# Extract X and y from the data
-X = data[[col for col in data.columns if col.startswith('x')]].values
-y = data['y'].values
+# Optionally keep one row per distinct position (index built by transposition_index.py from the same csv), so
+# opening positions repeated across games are neither over-weighted nor on both sides of the train/test split
+transposition_index = None  # e.g. 'transposition_index.npz'
+if transposition_index is not None:
+    index = TranspositionIndex.load(transposition_index)
+    if len(index) != len(X):
+        raise ValueError(f'{transposition_index} indexes {len(index)} positions, but the dataset has {len(X)} rows.')
+    unique_rows = index.unique_rows()
+    X, y = X[unique_rows], y[unique_rows]
+    print(f'Training on {len(unique_rows)} distinct positions (of {len(index)} rows)')
 
 # Shuffle the data
 X, y = shuffle(X, y, random_state=42)
@@ -0,0 +1,311 @@
+'''
+PyTorch training engine for the Stockfish score MLP, with the architecture and optimiser settings of the sklearn
+MLPRegressor in mlp_regressor.py.
+
+Mini-batches are gathered straight from the memory-mapped board dataset written by FEN2matrix.py and trained
+with several intra-op threads. R^2 is evaluated on a configurable cadence over a fixed subsample of rows (the
+full sets after the last epoch), and figures are rendered by a background thread, so neither stalls training.
+'''
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from board_dataset import load_board_dataset
+from transposition_index import TranspositionIndex
+
+
+HIDDEN_LAYER_SIZES = (128, 256, 512, 1024, 1024, 512, 256, 128, 64, 32)
+
+R2_text = r'$R^2$'
+
+
+class MLP(torch.nn.Module):
+    '''
+    Fully connected ReLU network with a linear output and Glorot-initialised weights, as sklearn's MLPRegressor.
+    '''
+
+    def __init__(self, input_dim, hidden_layer_sizes=HIDDEN_LAYER_SIZES):
+        super().__init__()
+        self.input_dim = input_dim
+        self.hidden_layer_sizes = tuple(hidden_layer_sizes)
+
+        layers, width = [], input_dim
+        for size in self.hidden_layer_sizes:
+            layers += [torch.nn.Linear(width, size), torch.nn.ReLU()]
+            width = size
+        layers.append(torch.nn.Linear(width, 1))
+        for layer in layers:
+            if isinstance(layer, torch.nn.Linear):
+                torch.nn.init.xavier_uniform_(layer.weight)
+                torch.nn.init.zeros_(layer.bias)
+        self.layers = torch.nn.Sequential(*layers)
+
+    def forward(self, x):
+        return self.layers(x).squeeze(-1)
+
+
+def save_checkpoint(model, path, **metadata):
+    '''
+    Saves a trained MLP with what is needed to rebuild it (see load_checkpoint).
+    '''
+    torch.save({'input_dim': model.input_dim, 'hidden_layer_sizes': model.hidden_layer_sizes,
+                'state_dict': model.state_dict(), **metadata}, path)
+
+
+def load_checkpoint(path):
+    '''
+    Rebuilds an MLP saved by save_checkpoint, in eval mode.
+    '''
+    checkpoint = torch.load(path, map_location='cpu')
+    model = MLP(checkpoint['input_dim'], checkpoint['hidden_layer_sizes'])
+    model.load_state_dict(checkpoint['state_dict'])
+    return model.eval()
+
+
+def to_tensor(X):
+    '''
+    Converts a batch of encoded boards (int8, any trailing shape) into a float32 tensor of flat rows.
+    '''
+    X = np.asarray(X, dtype=np.float32)
+    return torch.from_numpy(X.reshape(len(X), -1))
+
+
+def iter_minibatches(X, y, indices, batch_size, weights=None):
+    '''
+    Gathers mini-batches of the given rows from (memory-mapped) arrays. Rows are read in ascending order within
+    each batch, for locality; the batch order itself follows indices.
+
+    :return: Generator of (X, y, weights or None) tensor tuples.
+    '''
+    for start in range(0, len(indices), batch_size):
+        rows = np.sort(indices[start:start + batch_size])
+        yield (to_tensor(X[rows]), torch.from_numpy(np.asarray(y[rows], dtype=np.float32)),
+               None if weights is None else torch.from_numpy(weights[rows]))
+
+
+def predict(model, X, indices, batch_size=8192):
+    '''
+    Predicts the given rows, in the order given.
+    '''
+    model.eval()
+    order = np.argsort(indices, kind='stable')
+    predictions = np.empty(len(indices), dtype=np.float32)
+    with torch.inference_mode():
+        for start in range(0, len(indices), batch_size):
+            chunk = order[start:start + batch_size]
+            predictions[chunk] = model(to_tensor(X[indices[chunk]])).numpy()
+    return predictions
+
+
+def r2_score(y_true, y_pred):
+    y_true = np.asarray(y_true, dtype=np.float64)
+    ss_res = np.sum((y_true - y_pred) ** 2)
+    ss_tot = np.sum((y_true - y_true.mean()) ** 2)
+    return 1 - ss_res / ss_tot if ss_tot > 0 else 0.0
+
+
+class FigureWriter:
+    '''
+    Renders and saves figures on a background thread. Uses matplotlib's object-oriented Agg API rather than
+    pyplot, which is not thread-safe.
+    '''
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            plot, args = job
+            try:
+                plot(*args)
+            except Exception as e:
+                print(f'Failed to render figure {args[0]}: {e}')
+
+    def submit(self, plot, *args):
+        '''
+        Queues plot(*args); the arguments must not be modified afterwards.
+        '''
+        self.jobs.put((plot, args))
+
+    def close(self):
+        '''
+        Waits for every queued figure to be written.
+        '''
+        self.jobs.put(None)
+        self.thread.join()
+
+
+def plot_real_vs_pred(path, y_true, y_pred, epoch, r2):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.scatter(y_true, y_pred, marker='x', alpha=0.4, label='Data')
+    ax.plot([-100, 100], [-100, 100], color='red', label='Optimal y=x Line')
+    ax.set_title(f'Real vs Predicted Stockfish Scores\n(Epoch: {epoch}, {R2_text} Score: {round(r2, 3)})')
+    ax.set_xlabel('Real Stockfish Score')
+    ax.set_ylabel('Predicted Stockfish Score')
+    ax.grid()
+    ax.set_xlim([min(y_true)*1.2, max(y_true)*1.2])
+    ax.set_ylim([min(y_true)*1.2, max(y_true)*1.2])
+    ax.legend()
+    fig.savefig(path, dpi=500)
+
+
+def plot_curves(path, title, ylabel, curves):
+    '''
+    :param curves: List of (label or None, epochs, values, marker) tuples.
+    '''
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for label, epochs, values, marker in curves:
+        ax.plot(epochs, values, label=label, marker=marker)
+    ax.set_title(title)
+    ax.set_xlabel('Epoch')
+    ax.set_ylabel(ylabel)
+    if any(label is not None for label, _, _, _ in curves):
+        ax.legend()
+    ax.grid()
+    fig.savefig(path, dpi=500)
+
+
+def train(X, y, train_idx, test_idx, epochs=50, batch_size=200, learning_rate=1e-4, alpha=1e-4,
+          sample_weights=None, eval_every=1, eval_subsample=10000, plot_every=10, figures_dir='figures',
+          num_threads=None, seed=42):
+    '''
+    Trains an MLP on mini-batches of the given rows.
+
+    :param X: Encoded boards, (N, ...) int8 (typically memory-mapped).
+    :param y: Targets, (N,) float32.
+    :param train_idx: Training rows; reshuffled every epoch.
+    :param test_idx: Test rows.
+    :param batch_size: Rows per mini-batch (sklearn's default is min(200, N)).
+    :param alpha: L2 penalty, applied as sklearn does (alpha / batch_size per step, through Adam's weight_decay).
+    :param sample_weights: Optional (N,) float32 per-row loss weights, e.g. TranspositionIndex.sample_weights().
+    :param eval_every: Evaluate R^2 every this many epochs (and always after the last).
+    :param eval_subsample: Number of train and test rows used for the per-epoch R^2 (None for all).
+                           The final evaluation always uses every row.
+    :param plot_every: Save a real vs predicted figure on epochs 1, 1 + plot_every, ... when they are evaluated (None to skip).
+    :param figures_dir: Directory for the figures (None to skip every figure).
+    :param num_threads: Intra-op threads (defaults to the number of cores).
+    :return: Tuple of (trained model, history dict of per-epoch 'loss' and per-evaluation 'epoch', 'r2_train', 'r2_test').
+    '''
+    torch.set_num_threads(num_threads or os.cpu_count())
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+
+    train_idx, test_idx = np.asarray(train_idx), np.asarray(test_idx)
+    if eval_subsample is None:
+        train_eval, test_eval = train_idx, test_idx
+    else:
+        train_eval = rng.choice(train_idx, min(eval_subsample, len(train_idx)), replace=False)
+        test_eval = rng.choice(test_idx, min(eval_subsample, len(test_idx)), replace=False)
+
+    model = MLP(int(np.prod(X.shape[1:])))
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate, betas=(0.9, 0.999), eps=1e-8,
+                                 weight_decay=alpha / batch_size)
+    weights = None if sample_weights is None else np.asarray(sample_weights, dtype=np.float32)
+
+    figures = FigureWriter() if figures_dir is not None else None
+    history = {'loss': [], 'epoch': [], 'r2_train': [], 'r2_test': []}
+
+    print('Training Epoch Results:')
+    for epoch in range(1, epochs + 1):
+        start_time = time.perf_counter()
+        model.train()
+        total_loss, total_weight = 0.0, 0.0
+        for X_batch, y_batch, w_batch in iter_minibatches(X, y, rng.permutation(train_idx), batch_size, weights):
+            optimizer.zero_grad()
+            squared_error = (model(X_batch) - y_batch) ** 2
+            if w_batch is None:
+                loss = squared_error.mean() / 2
+                batch_weight = len(y_batch)
+            else:
+                loss = (w_batch * squared_error).sum() / (2 * w_batch.sum())
+                batch_weight = float(w_batch.sum())
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * batch_weight
+            total_weight += batch_weight
+        # Half the (weighted) mean squared error, as sklearn's loss_ (without the L2 term).
+        history['loss'].append(total_loss / total_weight)
+        train_time = time.perf_counter() - start_time
+
+        message = f'Epoch {epoch}/{epochs}, Loss: {history["loss"][-1]:.4f}'
+        if epoch % eval_every == 0 or epoch == epochs:
+            y_test_pred = predict(model, X, test_eval)
+            r2_train = r2_score(y[train_eval], predict(model, X, train_eval))
+            r2_test = r2_score(y[test_eval], y_test_pred)
+            history['epoch'].append(epoch)
+            history['r2_train'].append(r2_train)
+            history['r2_test'].append(r2_test)
+            message += f', R^2 Train: {r2_train:.4f}, R^2 Test: {r2_test:.4f}'
+
+            if figures is not None and plot_every is not None and (epoch - 1) % plot_every == 0:
+                figures.submit(plot_real_vs_pred, os.path.join(figures_dir, f'mlp_real_vs_pred_epoch_{epoch}.png'),
+                               np.asarray(y[test_eval]), y_test_pred, epoch, r2_test)
+        print(f'{message} ({train_time:.1f}s training, {time.perf_counter() - start_time - train_time:.1f}s evaluation)')
+
+    # Final R^2 Scores, on every row
+    history['final_r2_train'] = r2_score(y[train_idx], predict(model, X, train_idx))
+    history['final_r2_test'] = r2_score(y[test_idx], predict(model, X, test_idx))
+    print(f'\nFinal R^2 Score on Training Data: {history["final_r2_train"]:.4f}')
+    print(f'Final R^2 Score on Test Data: {history["final_r2_test"]:.4f}')
+
+    if figures is not None:
+        epoch_range = list(range(1, epochs + 1))
+        figures.submit(plot_curves, os.path.join(figures_dir, 'mlp_training_loss.png'), 'Training Loss Over Epochs',
+                       'Loss', [(None, epoch_range, history['loss'], 'o')])
+        figures.submit(plot_curves, os.path.join(figures_dir, 'MLP_R2_score.png'), f'{R2_text} Score Over Epochs',
+                       f'{R2_text} Score', [(f'Train {R2_text} Score', history['epoch'], history['r2_train'], 'o'),
+                                            (f'Test {R2_text} Score', history['epoch'], history['r2_test'], 's')])
+        figures.close()
+
+    return model, history
+
+
+# Trains the MLP on the binary dataset written by FEN2matrix.py, in place of mlp_regressor.py.
+if __name__ == '__main__':
+
+    dataset = 'interim_dataset'
+    checkpoint = 'mlp_checkpoint.pt'
+    test_size = 0.2
+    seed = 42
+
+    # Optional transposition index (transposition_index.py): splits train/test by distinct position, evaluates
+    # every test position once, and weights training rows by how often their position repeats.
+    transposition_index = None  # e.g. 'transposition_index.npz'
+    weighting = 'inverse'
+
+    X, y = load_board_dataset(dataset)
+    rng = np.random.default_rng(seed)
+
+    sample_weights = None
+    if transposition_index is None:
+        rows = rng.permutation(len(X))
+        test_idx, train_idx = rows[:int(test_size*len(rows))], rows[int(test_size*len(rows)):]
+    else:
+        index = TranspositionIndex.load(transposition_index)
+        if len(index) != len(X):
+            raise ValueError(f'{transposition_index} indexes {len(index)} positions, but the dataset has {len(X)} rows.')
+        positions = rng.permutation(index.num_unique)
+        test_positions = positions[:int(test_size*len(positions))]
+        test_idx = index.first_rows[test_positions]
+        train_idx = np.flatnonzero(~np.isin(index.position_ids, test_positions))
+        sample_weights = index.sample_weights(weighting)
+
+    model, history = train(X, y, train_idx, test_idx, seed=seed, sample_weights=sample_weights)
+    save_checkpoint(model, checkpoint, final_r2_test=history['final_r2_test'])
+    print(f'Saved model to {checkpoint}')
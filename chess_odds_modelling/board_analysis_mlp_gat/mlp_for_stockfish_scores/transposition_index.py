@@ -0,0 +1,142 @@
+'''
+Transposition index of a position corpus: which rows hold the same position, and how often each position occurs.
+
+Positions are keyed by their Polyglot Zobrist hash (chess.polyglot.zobrist_hash), which covers the placement,
+side to move, castling rights and en passant square, so transpositions reached by different move orders
+(and at different move numbers) share a key.
+'''
+
+import chess
+import chess.polyglot
+import numpy as np
+import pandas as pd
+
+
+def zobrist_keys(fens):
+    '''
+    Hashes every FEN with the Polyglot Zobrist hash.
+
+    :return: np.ndarray of uint64 keys, one per FEN.
+    '''
+    return np.fromiter((chess.polyglot.zobrist_hash(chess.Board(fen)) for fen in fens), dtype=np.uint64, count=len(fens))
+
+
+class TranspositionIndex:
+    '''
+    Maps every row of a corpus to its distinct position, with occurrence counts.
+    '''
+
+    def __init__(self, row_keys=None):
+        '''
+        :param row_keys: Zobrist key of every row, in corpus order.
+        '''
+        self.row_keys = np.empty(0, dtype=np.uint64) if row_keys is None else np.asarray(row_keys, dtype=np.uint64)
+        self._reindex()
+
+    @classmethod
+    def from_fens(cls, fens):
+        return cls(zobrist_keys(fens))
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path)['row_keys'])
+
+    def save(self, path):
+        np.savez(path, row_keys=self.row_keys)
+
+    def _reindex(self):
+        # keys: distinct positions (sorted); first_rows: first row of each; position_ids: distinct position of each row.
+        self.keys, self.first_rows, self.position_ids, self.counts = np.unique(
+            self.row_keys, return_index=True, return_inverse=True, return_counts=True)
+
+    def add(self, fens):
+        '''
+        Appends rows to the corpus, updating the occurrence counts.
+        '''
+        self.row_keys = np.concatenate([self.row_keys, zobrist_keys(fens)])
+        self._reindex()
+
+    def __len__(self):
+        return len(self.row_keys)
+
+    @property
+    def num_unique(self):
+        return len(self.keys)
+
+    def count(self, fen):
+        '''
+        Returns how many rows hold the position of the given FEN.
+        '''
+        key = np.uint64(chess.polyglot.zobrist_hash(chess.Board(fen)))
+        pos = np.searchsorted(self.keys, key)
+        return int(self.counts[pos]) if pos < len(self.keys) and self.keys[pos] == key else 0
+
+    def row_counts(self):
+        '''
+        Returns the occurrence count of every row's position, in corpus order.
+        '''
+        return self.counts[self.position_ids]
+
+    def unique_rows(self):
+        '''
+        Returns the first row of every distinct position, in corpus order (e.g. the rows to score or encode once).
+        '''
+        return np.sort(self.first_rows)
+
+    def sample_weights(self, scheme='inverse'):
+        '''
+        Per-row training weights that undo (or damp) the over-representation of repeated positions.
+
+        :param scheme: 'inverse' gives every distinct position the same total weight (1 / count per row),
+                       'sqrt' damps repeats by 1 / sqrt(count), and 'none' weights every row equally.
+        :return: np.ndarray of float32 weights, one per row, scaled to a mean of 1.
+        '''
+        counts = self.row_counts().astype(np.float64)
+        if scheme == 'inverse':
+            weights = 1 / counts
+        elif scheme == 'sqrt':
+            weights = 1 / np.sqrt(counts)
+        elif scheme == 'none':
+            weights = np.ones_like(counts)
+        else:
+            raise ValueError(f"Unknown weighting scheme '{scheme}' (expected 'inverse', 'sqrt' or 'none').")
+        return (weights / weights.mean()).astype(np.float32) if len(weights) else weights.astype(np.float32)
+
+    def report(self, fens=None, top=10):
+        '''
+        Summarises how duplicated the corpus is.
+
+        :param fens: Optional FENs of the corpus, to show an example of each of the most repeated positions.
+        :param top: Number of most repeated positions to list.
+        :return: Dict of statistics.
+        '''
+        rows, unique = len(self), self.num_unique
+        order = np.argsort(-self.counts, kind='stable')[:top]
+        most_repeated = [{'key': f'{int(self.keys[i]):016x}', 'count': int(self.counts[i]),
+                          'fen': fens[self.first_rows[i]] if fens is not None else None} for i in order]
+        return {
+            'rows': rows,
+            'unique_positions': unique,
+            'duplicate_rows': rows - unique,
+            'duplication_ratio': (rows - unique) / rows if rows else 0.0,
+            'repeated_positions': int((self.counts > 1).sum()),
+            'most_repeated': most_repeated,
+        }
+
+
+# Builds the index of the stockfish scores csv, and reports how duplicated it is.
+if __name__ == '__main__':
+
+    filename = 'stockfish_scores_depth_20_interim.csv'
+    index_file = 'transposition_index.npz'
+
+    FENs = list(pd.read_csv(filename)['FEN'])
+    index = TranspositionIndex.from_fens(FENs)
+    index.save(index_file)
+
+    report = index.report(FENs)
+    print(f"{report['rows']} rows, {report['unique_positions']} distinct positions "
+          f"({report['duplicate_rows']} duplicate rows, {report['duplication_ratio']:.1%} of the corpus).")
+    print(f"{report['repeated_positions']} positions occur more than once. Most repeated:")
+    for entry in report['most_repeated']:
+        print(f"  {entry['count']:6d}x  {entry['fen']}")
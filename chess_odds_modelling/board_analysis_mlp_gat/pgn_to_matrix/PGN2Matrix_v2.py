@@ -1,72 +1,78 @@
-import chess.pgn
-import numpy as np
+import chess
+import os
+import sys
 
-# Define a function to convert a board into an 8x8 matrix
+from pgn_index import iter_indexed_games
+from pgn_stream import iter_mainline_positions, iter_pgn_games
+
+# Batch FEN encoder lives alongside the MLP scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mlp_for_stockfish_scores'))
+from fen_batch_encoder import fens_to_matrices
+
+# Define a function to convert a board into an 8x8 matrix (rank 8 in the top row)
 def board_to_matrix(board):
-    piece_map = board.piece_map()  # Get a mapping of pieces on the board
-    matrix = np.zeros((8, 8), dtype=int)  # Initialize an 8x8 matrix
-
-    for square, piece in piece_map.items():
-        row, col = divmod(square, 8)
-        # Map pieces to positive/negative integers
-        piece_value = {
-            chess.PAWN: 1,
-            chess.KNIGHT: 2,
-            chess.BISHOP: 3,
-            chess.ROOK: 4,
-            chess.QUEEN: 5,
-            chess.KING: 6,
-        }.get(piece.piece_type, 0)
-        # Use positive for white and negative for black
-        matrix[7 - row, col] = piece_value if piece.color == chess.WHITE else -piece_value
-
-    return matrix
-
-total_positions = 0
-
-# Open the PGN file
+    # Encoded from the placement field with NumPy lookup tables, rather than square by square
+    return fens_to_matrices([board.board_fen()], rank_order='a8')[0]
+
+# Open the PGN file (plain, or a .bz2/.gz/.zst compressed dump)
 pgn_file = 'lichess_LordJedizor_2024-12-26.pgn'  # Replace with your PGN file path
-with open(pgn_file) as pgn:
-    # Iterate through all games in the PGN file
+
+# Optional header-only filter, e.g. pgn_stream.header_filter(min_rating=2000, time_controls={'180+0'})
+game_filter = None
+
+# Number of processes parsing byte ranges of the file in parallel (plain PGN files only; 1 streams the file)
+num_workers = 1
+
+# Ply to stop replaying each game at, e.g. 20 (None replays the whole game)
+move_number = None
+
+
+def main():
+
+    total_positions = 0
+
+    # Worker processes re-import this module (spawn on Windows), so the pool is only started from main()
+    if num_workers > 1:
+        games = iter_indexed_games(pgn_file, num_workers, game_filter)
+    else:
+        games = ((game_idx, headers, iter_mainline_positions(headers, movetext, game_idx))
+                 for game_idx, headers, movetext in iter_pgn_games(pgn_file, game_filter))
+
+    # Iterate through all games in the PGN file (headers and mainline moves only), in PGN order
     game_count = 0
-    while True:
-        game = chess.pgn.read_game(pgn)
-        if game is None:
-            break  # No more games in the file
+    for game_idx, headers, positions in games:
 
         # Print basic information about the game
         game_count += 1
-        print(f'Game {game_count}:')
-        print('Event:', game.headers.get('Event', 'Unknown'))
-        print('White:', game.headers.get('White', 'Unknown'))
-        print('Black:', game.headers.get('Black', 'Unknown'))
-        print('Result:', game.headers.get('Result', 'Unknown'))
+        print(f'Game {game_idx}:')
+        print('Event:', headers.get('Event', 'Unknown'))
+        print('White:', headers.get('White', 'Unknown'))
+        print('Black:', headers.get('Black', 'Unknown'))
+        print('Result:', headers.get('Result', 'Unknown'))
         print('-' * 40)
 
-        # Process moves in the game (optional)
-        board = game.board()
-        # Go to move 20
-        move_number = 20
-        for i, move in enumerate(game.mainline_moves()):
-            board.push(move)
+        # Process moves in the game (optional), replaying the mainline once
+        board = chess.Board(headers['FEN']) if 'FEN' in headers else chess.Board()
+        fen = board.fen()
+        for _, ply, fen, turn in positions:
             total_positions += 1
-            '''
-            if i + 1 == move_number:
+            if ply == move_number:
                 break
-            '''
-        
+        board = chess.Board(fen)
+
         # Convert to matrix
         matrix = board_to_matrix(board)
         print('Board at move 20:')
         print(matrix)
-        
+
         # Display the board in the terminal
         print('Board at move 20:')
         print(board)
 
-print(f'Total games processed: {game_count}')
-
-print(f'Total positions: {total_positions}')
+    print(f'Total games processed: {game_count}')
 
+    print(f'Total positions: {total_positions}')
 
 
+if __name__ == '__main__':
+    main()
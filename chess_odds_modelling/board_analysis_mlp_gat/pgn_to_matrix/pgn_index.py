@@ -0,0 +1,134 @@
+'''
+Byte-offset index of the games in a PGN file, for O(1) random access to any game and for parsing
+disjoint byte ranges of the file in parallel.
+
+The index is built once, by a line scan with the same game-splitting rule as pgn_stream, and saved next
+to the PGN file (<pgn_file>.index.npz). It is rebuilt automatically if the PGN file changes. Only
+uncompressed PGN files can be indexed, since compressed streams cannot be seeked into.
+'''
+
+import io
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from pgn_stream import iter_mainline_positions, parse_headers, split_games
+
+
+class PGNIndex:
+    '''
+    Start offsets of every game in a PGN file, with game k (1-based, as game_idx elsewhere) at offsets[k - 1].
+    '''
+
+    def __init__(self, pgn_file, rebuild=False):
+        '''
+        :param pgn_file: Path to an uncompressed PGN file.
+        :param rebuild: Whether to rebuild the index even if an up-to-date one exists.
+        '''
+        if pgn_file.endswith(('.bz2', '.gz', '.zst')):
+            raise ValueError(f'{pgn_file} is compressed; only plain PGN files can be indexed by byte offset.')
+        self.pgn_file = pgn_file
+        self.index_file = pgn_file + '.index.npz'
+
+        stat = os.stat(pgn_file)
+        if not rebuild and os.path.exists(self.index_file):
+            saved = np.load(self.index_file)
+            if int(saved['size']) == stat.st_size and int(saved['mtime_ns']) == stat.st_mtime_ns:
+                self.offsets = saved['offsets']
+                self.size = stat.st_size
+                return
+
+        with open(pgn_file, 'rb', buffering=1 << 20) as f:
+            self.offsets = np.array([offset for offset, _, _ in split_games(f)], dtype=np.int64)
+        self.size = stat.st_size
+        np.savez(self.index_file, offsets=self.offsets, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def game_range(self, game_idx):
+        '''
+        Returns the (start, end) byte range of game game_idx (1-based).
+        '''
+        if not 1 <= game_idx <= len(self):
+            raise IndexError(f'Game {game_idx} out of range for {self.pgn_file} ({len(self)} games).')
+        end = self.offsets[game_idx] if game_idx < len(self) else self.size
+        return int(self.offsets[game_idx - 1]), int(end)
+
+    def read_game(self, game_idx):
+        '''
+        Reads a single game, seeking straight to it.
+
+        :return: Tuple of (headers dict, movetext).
+        '''
+        start, end = self.game_range(game_idx)
+        with open(self.pgn_file, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        _, header_lines, movetext_lines = next(split_games(io.BytesIO(data)))
+        return parse_headers(header_lines), b''.join(movetext_lines).decode('utf-8', 'replace')
+
+    def shards(self, num_shards):
+        '''
+        Splits the games into up to num_shards contiguous ranges of roughly equal byte size.
+
+        :return: List of (first game_idx, start offset, end offset) tuples.
+        '''
+        if not len(self):
+            return []
+        targets = np.linspace(0, self.size, num_shards + 1)[1:-1]
+        cuts = np.unique(np.concatenate([[0], np.searchsorted(self.offsets, targets), [len(self)]]))
+        return [(int(a) + 1, int(self.offsets[a]), int(self.offsets[b]) if b < len(self) else self.size)
+                for a, b in zip(cuts[:-1], cuts[1:])]
+
+
+def parse_shard(args):
+    '''
+    Pool task: parses every game in one byte range of a PGN file.
+
+    :param args: Tuple of (pgn_file, first game_idx, start offset, end offset, game filter or None).
+    :return: List of (game_idx, headers, positions) tuples for the games that pass the filter,
+             where positions is a list of (game_idx, ply, fen, turn) tuples.
+    '''
+    pgn_file, first_game_idx, start, end, game_filter = args
+    with open(pgn_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    games = []
+    for game_idx, (_, header_lines, movetext_lines) in enumerate(split_games(io.BytesIO(data)), start=first_game_idx):
+        headers = parse_headers(header_lines)
+        if game_filter is None or game_filter(headers):
+            movetext = b''.join(movetext_lines).decode('utf-8', 'replace')
+            games.append((game_idx, headers, list(iter_mainline_positions(headers, movetext, game_idx))))
+    return games
+
+
+def iter_indexed_games(pgn_file, num_workers=None, game_filter=None, shards_per_worker=8):
+    '''
+    Parses a PGN file across a process pool, one byte range per task, yielding games in PGN order.
+
+    :param pgn_file: Path to an uncompressed PGN file (indexed on first use).
+    :param num_workers: Number of worker processes (defaults to the number of cores).
+    :param game_filter: Optional picklable function of a headers dict, e.g. from pgn_stream.header_filter.
+    :param shards_per_worker: Byte ranges per worker, to balance the load.
+    :return: Generator of (game_idx, headers, positions) tuples (see parse_shard).
+    '''
+    num_workers = num_workers or os.cpu_count()
+    index = PGNIndex(pgn_file)
+    tasks = [(pgn_file, first, start, end, game_filter) for first, start, end in index.shards(num_workers * shards_per_worker)]
+
+    with Pool(num_workers) as pool:
+        for games in pool.imap(parse_shard, tasks):
+            yield from games
+
+
+def iter_indexed_positions(pgn_file, num_workers=None, game_filter=None):
+    '''
+    As pgn_stream.iter_stream_positions, but parsed across a process pool.
+
+    :return: Generator of (game_idx, ply, fen, turn) tuples, in PGN order.
+    '''
+    for _, _, positions in iter_indexed_games(pgn_file, num_workers, game_filter):
+        yield from positions
@@ -0,0 +1,18 @@
+from pgn_index import iter_indexed_positions
+from pgn_stream import iter_stream_positions
+
+
+def iter_pgn_positions(pgn_file, game_filter=None, num_workers=1):
+    '''
+    Streams the positions of every game in a PGN file, in PGN order.
+
+    :param pgn_file: Path to the PGN file (plain, or .bz2/.gz/.zst compressed).
+    :param game_filter: Optional function of a game's headers dict, deciding whether to keep it (see pgn_stream.header_filter).
+    :param num_workers: Number of processes parsing byte ranges of the file in parallel (plain PGN files only, see pgn_index).
+    :return: Generator of (game_idx, ply, fen, turn) tuples, with game_idx starting at 1 and counting every game.
+    '''
+    if num_workers > 1 and not pgn_file.endswith(('.bz2', '.gz', '.zst')):
+        return iter_indexed_positions(pgn_file, num_workers, game_filter)
+
+    # Mainline-only streaming parse, rather than chess.pgn.read_game's full game tree.
+    return iter_stream_positions(pgn_file, game_filter)
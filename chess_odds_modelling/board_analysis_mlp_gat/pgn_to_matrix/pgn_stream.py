@@ -0,0 +1,186 @@
+'''
+Streaming PGN ingest, for whole (compressed) Lichess database dumps.
+
+Games are split on header blocks line by line, without parsing the movetext of games rejected by a
+header-only filter. Accepted games have their comments, NAGs and variations stripped, and only the mainline
+SAN moves are replayed; no game tree is ever built. Plain, .bz2, .gz and .zst files are read directly
+(.zst needs the zstandard package).
+'''
+
+import bz2
+import gzip
+import io
+import re
+from functools import partial
+
+import chess
+
+
+_HEADER_RE = re.compile(rb'^\[(\w+)\s+"(.*)"\]\s*$')
+_COMMENT_RE = re.compile(r'\{[^}]*\}|;[^\n]*')
+_VARIATION_RE = re.compile(r'\([^()]*\)')
+_NOISE_RE = re.compile(r'\$\d+|\d+\.+|[?!]+')
+_RESULTS = {'1-0', '0-1', '1/2-1/2', '*'}
+
+
+def open_pgn(pgn_file):
+    '''
+    Opens a PGN file for buffered binary line reading, decompressing on the fly by extension.
+
+    :param pgn_file: Path to a .pgn, .pgn.bz2, .pgn.gz or .pgn.zst file.
+    :return: Binary file object.
+    '''
+    if pgn_file.endswith('.bz2'):
+        return bz2.open(pgn_file, 'rb')
+    if pgn_file.endswith('.gz'):
+        return gzip.open(pgn_file, 'rb')
+    if pgn_file.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('Reading .zst PGN dumps needs the zstandard package (pip install zstandard).')
+        raw = open(pgn_file, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.BufferedReader(reader, buffer_size=1 << 20)
+    return open(pgn_file, 'rb', buffering=1 << 20)
+
+
+def header_filter(min_rating=None, max_rating=None, time_controls=None, date_from=None, date_to=None, events=None):
+    '''
+    Builds a game filter that only looks at headers (picklable, so it can be sent to worker processes).
+
+    :param min_rating: Minimum Elo of both players (games with unknown ratings fail).
+    :param max_rating: Maximum Elo of both players (games with unknown ratings fail).
+    :param time_controls: Collection of accepted TimeControl values, e.g. {'180+0', '600+0'}.
+    :param date_from: Earliest date, as 'YYYY.MM.DD' (UTCDate, falling back to Date).
+    :param date_to: Latest date, as 'YYYY.MM.DD'.
+    :param events: Collection of substrings, one of which must appear in the Event header (e.g. 'Rated Blitz').
+    :return: Function of a headers dict, returning True for games to keep.
+    '''
+    time_controls = set(time_controls) if time_controls is not None else None
+    return partial(_accept_headers, min_rating=min_rating, max_rating=max_rating, time_controls=time_controls,
+                   date_from=date_from, date_to=date_to, events=events)
+
+
+def _accept_headers(headers, min_rating, max_rating, time_controls, date_from, date_to, events):
+    if min_rating is not None or max_rating is not None:
+        try:
+            ratings = int(headers['WhiteElo']), int(headers['BlackElo'])
+        except (KeyError, ValueError):
+            return False
+        if min_rating is not None and min(ratings) < min_rating:
+            return False
+        if max_rating is not None and max(ratings) > max_rating:
+            return False
+    if time_controls is not None and headers.get('TimeControl') not in time_controls:
+        return False
+    if date_from is not None or date_to is not None:
+        date = headers.get('UTCDate', headers.get('Date', ''))
+        if '?' in date or not date:
+            return False
+        if (date_from is not None and date < date_from) or (date_to is not None and date > date_to):
+            return False
+    if events is not None and not any(event in headers.get('Event', '') for event in events):
+        return False
+    return True
+
+
+def split_games(lines):
+    '''
+    Splits PGN lines into games, on header blocks: a header line after movetext (or after a blank line) starts a new game.
+
+    :param lines: Iterable of PGN lines, as bytes (e.g. a binary file object).
+    :return: Generator of (offset, header lines, movetext lines) tuples, where offset is the byte offset of the
+             game's first line, relative to the first line given.
+    '''
+    offset = 0
+    game_offset, header_lines, movetext_lines = None, [], []
+    in_movetext = blank_since_header = False
+
+    for line in lines:
+        if line.startswith(b'['):
+            if game_offset is None or in_movetext or blank_since_header:
+                if game_offset is not None:
+                    yield game_offset, header_lines, movetext_lines
+                game_offset, header_lines, movetext_lines = offset, [], []
+                in_movetext = blank_since_header = False
+            header_lines.append(line)
+        elif not line.strip():
+            blank_since_header = game_offset is not None
+        elif game_offset is not None:
+            in_movetext = True
+            movetext_lines.append(line)
+        offset += len(line)
+
+    if game_offset is not None:
+        yield game_offset, header_lines, movetext_lines
+
+
+def parse_headers(header_lines):
+    '''
+    Parses a game's header lines (bytes) into a dict of tag name to value.
+    '''
+    headers = {}
+    for line in header_lines:
+        match = _HEADER_RE.match(line)
+        if match:
+            headers[match.group(1).decode('utf-8', 'replace')] = match.group(2).decode('utf-8', 'replace')
+    return headers
+
+
+def iter_pgn_games(pgn_file, game_filter=None):
+    '''
+    Splits a PGN stream into games, yielding the headers and raw movetext of every game that passes the filter.
+
+    :param pgn_file: Path to the (optionally compressed) PGN file.
+    :param game_filter: Optional function of a headers dict (see header_filter); rejected games are skipped
+                        without decoding their movetext.
+    :return: Generator of (game_idx, headers, movetext) tuples, with game_idx counting every game from 1.
+    '''
+    with open_pgn(pgn_file) as f:
+        for game_idx, (_, header_lines, movetext_lines) in enumerate(split_games(f), start=1):
+            headers = parse_headers(header_lines)
+            if game_filter is None or game_filter(headers):
+                yield game_idx, headers, b''.join(movetext_lines).decode('utf-8', 'replace')
+
+
+def mainline_sans(movetext):
+    '''
+    Extracts the mainline moves of a game's movetext, dropping comments, variations, NAGs, move numbers and the result.
+
+    :param movetext: Raw movetext of one game.
+    :return: List of SAN strings.
+    '''
+    text = _COMMENT_RE.sub(' ', movetext)
+    while '(' in text:
+        stripped = _VARIATION_RE.sub(' ', text)
+        if stripped == text:
+            break  # Unbalanced parentheses.
+        text = stripped
+    return [token for token in _NOISE_RE.sub(' ', text).split() if token not in _RESULTS]
+
+
+def iter_mainline_positions(headers, movetext, game_idx=1):
+    '''
+    Replays the mainline of one game once, yielding the position after every move.
+    Replay stops at the first illegal or unreadable move, as chess.pgn.read_game does.
+
+    :return: Generator of (game_idx, ply, fen, turn) tuples, where turn is the side to move (True = White).
+    '''
+    board = chess.Board(headers['FEN']) if 'FEN' in headers else chess.Board()
+    for ply, san in enumerate(mainline_sans(movetext), start=1):
+        try:
+            board.push_san(san)
+        except ValueError:
+            return
+        yield game_idx, ply, board.fen(), board.turn
+
+
+def iter_stream_positions(pgn_file, game_filter=None):
+    '''
+    Streams the positions of every game in a (optionally compressed) PGN file that passes the filter, in PGN order.
+
+    :return: Generator of (game_idx, ply, fen, turn) tuples.
+    '''
+    for game_idx, headers, movetext in iter_pgn_games(pgn_file, game_filter):
+        yield from iter_mainline_positions(headers, movetext, game_idx)
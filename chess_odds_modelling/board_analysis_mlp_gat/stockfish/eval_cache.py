@@ -0,0 +1,120 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+
+# Version of the stored result format, part of the table name so results in an older format are never read back.
+# 1: bare float score (table 'evals'); 2: multi-PV result dict (see stockfish_scoring_v8.analyze_position_with_stockfish).
+RESULT_FORMAT = 2
+TABLE = f'evals_v{RESULT_FORMAT}'
+
+
+def normalise_fen(fen):
+    '''
+    Strips the halfmove clock and fullmove number from a FEN, leaving only what the engine evaluates.
+
+    :param fen: FEN string of the chess position.
+    :return: FEN string made of the placement, side to move, castling and en passant fields.
+    '''
+    return ' '.join(fen.split()[:4])
+
+
+def engine_build_hash(engine_path):
+    '''
+    Hashes the engine binary, so evaluations from different Stockfish builds are never mixed up.
+
+    :param engine_path: Path to the UCI engine binary.
+    :return: Hex SHA-256 digest of the binary.
+    '''
+    sha = hashlib.sha256()
+    with open(engine_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class EvalCache:
+    '''
+    A persistent SQLite cache of engine evaluations, keyed by (normalised FEN, search, engine build), in a table
+    per result format (older formats' tables are left untouched and ignored).
+    Safe to share between the worker threads of an EnginePool.
+    '''
+
+    def __init__(self, db_path, engine_path, search, commit_every=500):
+        '''
+        :param db_path: Path to the SQLite file (created if missing).
+        :param engine_path: Path to the engine binary, hashed to identify the build.
+        :param search: Search limits the evaluations were made with, e.g. 'depth 20'.
+        :param commit_every: Number of new evaluations between commits.
+        '''
+        self.search = search
+        self.engine_hash = engine_build_hash(engine_path)
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+            'fen TEXT NOT NULL, search TEXT NOT NULL, engine TEXT NOT NULL, result TEXT NOT NULL, '
+            'PRIMARY KEY (fen, search, engine))'
+        )
+        self.conn.commit()
+
+    def get(self, fen):
+        '''
+        Looks up a cached evaluation, counting the lookup as a hit or a miss.
+
+        :param fen: FEN string of the chess position (move clocks are ignored).
+        :return: The cached result, or None if the position has not been evaluated yet.
+        '''
+        with self._lock:
+            row = self.conn.execute(
+                f'SELECT result FROM {TABLE} WHERE fen = ? AND search = ? AND engine = ?',
+                (normalise_fen(fen), self.search, self.engine_hash)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, fen, result):
+        '''
+        Stores an evaluation (any JSON-serialisable result).
+        '''
+        with self._lock:
+            self.conn.execute(
+                f'INSERT OR REPLACE INTO {TABLE} (fen, search, engine, result) VALUES (?, ?, ?, ?)',
+                (normalise_fen(fen), self.search, self.engine_hash, json.dumps(result))
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self.conn.commit()
+                self._uncommitted = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        '''
+        Returns a one-line summary of this run's cache usage.
+        '''
+        lookups = self.hits + self.misses
+        return f'Evaluation cache: {self.hits}/{lookups} hits ({self.hit_rate():.1%}), {self.misses} positions searched'
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,110 @@
+import json
+import os
+
+
+class ScoringJob:
+    '''
+    A resumable scoring job: CSV rows are written in batches, and a manifest records
+    the last (game, ply) covered by the output, so an interrupted run carries on where it stopped.
+    '''
+
+    def __init__(self, output_file, header, params=None, manifest_file=None, batch_size=200, resume=True):
+        '''
+        :param output_file: Path to the output CSV.
+        :param header: CSV header line (without newline).
+        :param params: Dict of job settings (e.g. PGN file, depth), which a resumed run must match.
+        :param manifest_file: Path to the progress manifest (defaults to output_file + '.manifest.json').
+        :param batch_size: Number of positions per checkpoint.
+        :param resume: Whether to continue from an existing manifest, rather than starting over.
+        '''
+        self.output_file = output_file
+        self.header = header
+        self.manifest_file = manifest_file or f'{output_file}.manifest.json'
+        self.params = params or {}
+        self.batch_size = batch_size
+        self.rows = []
+        self.pending_positions = 0
+
+        if resume and os.path.exists(self.manifest_file) and os.path.exists(output_file):
+            with open(self.manifest_file, 'r') as f:
+                self.manifest = json.load(f)
+            if self.manifest['params'] != self.params:
+                raise ValueError(f'{self.manifest_file} belongs to a job with different settings: {self.manifest["params"]}')
+            # Drops anything written after the last checkpoint (e.g. a half-written batch).
+            with open(output_file, 'r+') as out:
+                out.truncate(self.manifest['output_bytes'])
+        else:
+            with open(output_file, 'w') as out:
+                out.write(header)
+            self.manifest = {'params': self.params, 'last_game': 0, 'last_ply': 0, 'positions': 0, 'rows': 0,
+                             'output_bytes': os.path.getsize(output_file)}
+            self._write_manifest()
+
+    @property
+    def resume_point(self):
+        return self.manifest['last_game'], self.manifest['last_ply']
+
+    def is_done(self, game_idx, ply):
+        '''
+        Whether a position was already covered by a previous (checkpointed) run.
+        '''
+        return (game_idx, ply) <= self.resume_point
+
+    def skip_done(self, positions):
+        '''
+        Filters an iterator of (game_idx, ply, ...) tuples down to positions not yet scored.
+        '''
+        for position in positions:
+            if not self.is_done(position[0], position[1]):
+                yield position
+
+    def record(self, game_idx, ply, row=None):
+        '''
+        Records a position as processed, with its CSV row (or None if it could not be scored).
+        Positions must be recorded in PGN order.
+        '''
+        if row is not None:
+            self.rows.append(row)
+        self.manifest['last_game'], self.manifest['last_ply'] = game_idx, ply
+        self.pending_positions += 1
+        if self.pending_positions >= self.batch_size:
+            self.checkpoint()
+
+    def checkpoint(self):
+        '''
+        Appends the buffered rows to the output, then atomically replaces the manifest.
+        '''
+        if self.pending_positions == 0:
+            return
+
+        with open(self.output_file, 'a') as out:
+            out.write(''.join(f'\n{row}' for row in self.rows))
+            out.flush()
+            os.fsync(out.fileno())
+
+        self.manifest['positions'] += self.pending_positions
+        self.manifest['rows'] += len(self.rows)
+        self.manifest['output_bytes'] = os.path.getsize(self.output_file)
+        self._write_manifest()
+
+        self.rows = []
+        self.pending_positions = 0
+
+    def _write_manifest(self):
+        # Written to a temporary file first, so a crash never leaves a half-written manifest.
+        tmp_file = f'{self.manifest_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+
+    def close(self):
+        self.checkpoint()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Checkpoints whatever completed, including on KeyboardInterrupt.
+        self.close()
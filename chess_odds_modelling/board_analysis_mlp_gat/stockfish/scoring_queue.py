@@ -0,0 +1,156 @@
+import json
+import sqlite3
+import time
+
+
+class ScoringQueue:
+    '''
+    A SQLite-backed work queue of positions to score, shared by one coordinator and any number of workers.
+    Workers claim batches under a time-limited lease, so batches held by a crashed worker are handed out again.
+    Results are committed idempotently: the first result for a position wins, later duplicates are ignored.
+    '''
+
+    def __init__(self, db_path, timeout=60):
+        '''
+        :param db_path: Path to the SQLite queue file (created if missing).
+        :param timeout: Seconds to wait on a locked database before giving up.
+        '''
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS positions ('
+            'id INTEGER PRIMARY KEY, pgn_file TEXT NOT NULL, game_idx INTEGER NOT NULL, ply INTEGER NOT NULL, '
+            'fen TEXT NOT NULL, white_to_move INTEGER NOT NULL, '
+            "status TEXT NOT NULL DEFAULT 'pending', claimed_by TEXT, claimed_at REAL, "
+            'result TEXT, error TEXT, '
+            'UNIQUE (pgn_file, game_idx, ply))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS positions_status ON positions (status, claimed_at)')
+
+    def get_meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def enqueue(self, pgn_file, positions, chunk_size=5000):
+        '''
+        Shards positions into the queue. Positions already queued are skipped, so this can be re-run safely.
+
+        :param pgn_file: Name of the PGN file the positions come from.
+        :param positions: Iterable of (game_idx, ply, fen, turn) tuples, in PGN order.
+        :param chunk_size: Number of positions inserted per transaction.
+        :return: Number of newly queued positions.
+        '''
+        added = 0
+        chunk = []
+
+        def flush():
+            cursor = self.conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.executemany(
+                'INSERT OR IGNORE INTO positions (pgn_file, game_idx, ply, fen, white_to_move) VALUES (?, ?, ?, ?, ?)',
+                chunk
+            )
+            inserted = cursor.rowcount
+            cursor.execute('COMMIT')
+            return inserted
+
+        for game_idx, ply, fen, turn in positions:
+            chunk.append((pgn_file, game_idx, ply, fen, int(turn)))
+            if len(chunk) >= chunk_size:
+                added += flush()
+                chunk = []
+        if chunk:
+            added += flush()
+        return added
+
+    def claim(self, worker_id, batch_size, lease_seconds=600):
+        '''
+        Claims a batch of pending positions (or positions whose lease has expired) for a worker.
+
+        :param worker_id: Unique name of the claiming worker.
+        :param batch_size: Maximum number of positions to claim.
+        :param lease_seconds: How long the claim lasts before other workers may take the positions over.
+        :return: List of (position_id, fen, white_to_move) tuples; empty if nothing is claimable.
+        '''
+        now = time.time()
+        cursor = self.conn.cursor()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same rows.
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            rows = cursor.execute(
+                "SELECT id, fen, white_to_move FROM positions "
+                "WHERE status = 'pending' OR (status = 'claimed' AND claimed_at < ?) "
+                'ORDER BY id LIMIT ?',
+                (now - lease_seconds, batch_size)
+            ).fetchall()
+            cursor.executemany(
+                "UPDATE positions SET status = 'claimed', claimed_by = ?, claimed_at = ? WHERE id = ?",
+                [(worker_id, now, row[0]) for row in rows]
+            )
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        return [(position_id, fen, bool(white_to_move)) for position_id, fen, white_to_move in rows]
+
+    def complete(self, worker_id, results):
+        '''
+        Commits a batch of results. Positions that already have a result are left untouched.
+
+        :param worker_id: Name of the worker committing the results.
+        :param results: Iterable of (position_id, result, error) tuples, with result JSON-serialisable.
+        '''
+        rows = []
+        for position_id, result, error in results:
+            status = 'done' if error is None else 'failed'
+            rows.append((status, worker_id, None if result is None else json.dumps(result),
+                         None if error is None else str(error), position_id))
+
+        cursor = self.conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.executemany(
+                'UPDATE positions SET status = ?, claimed_by = ?, result = ?, error = ? '
+                "WHERE id = ? AND status NOT IN ('done', 'failed')",
+                rows
+            )
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+
+    def counts(self):
+        '''
+        :return: Dict of position counts by status ('pending', 'claimed', 'done', 'failed').
+        '''
+        counts = {'pending': 0, 'claimed': 0, 'done': 0, 'failed': 0}
+        for status, n in self.conn.execute('SELECT status, COUNT(*) FROM positions GROUP BY status'):
+            counts[status] = n
+        return counts
+
+    def iter_results(self):
+        '''
+        Streams finished positions in the order they were queued (i.e. PGN order).
+
+        :return: Generator of (pgn_file, game_idx, ply, fen, white_to_move, result, error) tuples.
+        '''
+        rows = self.conn.execute(
+            'SELECT pgn_file, game_idx, ply, fen, white_to_move, result, error FROM positions '
+            "WHERE status IN ('done', 'failed') ORDER BY id"
+        )
+        for pgn_file, game_idx, ply, fen, white_to_move, result, error in rows:
+            yield pgn_file, game_idx, ply, fen, bool(white_to_move), None if result is None else json.loads(result), error
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,184 @@
+'''
+Coordinator/worker mode for Stockfish scoring, for labelling more positions than one machine can handle.
+
+The coordinator shards the positions of PGN files into a SQLite queue file. Workers, on this or any node
+that can reach the queue file, claim batches, score them with local engines (search settings come from
+stockfish_scoring_v8.py) and commit the results. The coordinator then exports a CSV in PGN order.
+
+    python stockfish_scoring_distributed.py enqueue --queue q.sqlite games1.pgn games2.pgn
+    python stockfish_scoring_distributed.py worker --queue q.sqlite --engine ./stockfish --engines 8
+    python stockfish_scoring_distributed.py export --queue q.sqlite --output scores.csv
+
+Or everything on one box, with several local worker processes (e.g. against stub_uci_engine.py):
+
+    python stockfish_scoring_distributed.py local --queue q.sqlite --engine ./stub_uci_engine.py --workers 4 games.pgn
+'''
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import stockfish_scoring_v8 as scoring
+from scoring_queue import ScoringQueue
+from uci_engine import EnginePool
+
+# Shared single-pass PGN replay lives alongside the PGN to matrix scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pgn_to_matrix'))
+from pgn_positions import iter_pgn_positions
+from pgn_stream import header_filter
+
+
+
+def enqueue(queue_file, pgn_files, game_filter=None, parse_workers=1):
+    '''
+    Shards every position of the given PGN files into the queue (re-running only adds missing ones).
+
+    :param game_filter: Optional header-only game filter (see pgn_stream.header_filter).
+    :param parse_workers: Number of processes parsing each (plain) PGN file in parallel.
+    '''
+    with ScoringQueue(queue_file) as queue:
+        # A queue only ever holds results for one set of search settings.
+        queued_search = queue.get_meta('search')
+        if queued_search is None:
+            queue.set_meta('search', scoring.search)
+        elif queued_search != scoring.search:
+            raise ValueError(f'{queue_file} was created for search "{queued_search}", not "{scoring.search}".')
+
+        for pgn_file in pgn_files:
+            added = queue.enqueue(os.path.basename(pgn_file), iter_pgn_positions(pgn_file, game_filter, parse_workers))
+            print(f'{pgn_file}: {added} positions queued')
+        print(f'Queue status: {queue.counts()}')
+
+def score_claimed(engine, claimed):
+    '''
+    Pool task: scores one claimed (position_id, fen, white_to_move) position.
+
+    :return: Tuple of (search result, error), where exactly one is None.
+    '''
+    _, fen, _ = claimed
+    try:
+        return scoring.analyze_position_with_stockfish(fen, engine), None
+    except ValueError as ve:
+        return None, ve
+
+def work(queue_file, engine_path, num_engines, batch_size=64, lease_seconds=600, poll_seconds=10):
+    '''
+    Claims and scores batches until every queued position has a result.
+
+    :param queue_file: Path to the shared queue file.
+    :param engine_path: Path to the local UCI engine binary.
+    :param num_engines: Number of local engine processes.
+    :param batch_size: Positions claimed per batch.
+    :param lease_seconds: Time after which an uncommitted batch is handed to another worker.
+    :param poll_seconds: Wait between checks while other workers still hold claimed batches.
+    '''
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    with ScoringQueue(queue_file) as queue, \
+            EnginePool(engine_path, num_workers=num_engines, options={'MultiPV': scoring.multipv}) as pool:
+        if queue.get_meta('search') != scoring.search:
+            raise ValueError(f'{queue_file} was created for search "{queue.get_meta("search")}", not "{scoring.search}".')
+
+        scored = 0
+        while True:
+            batch = queue.claim(worker_id, batch_size, lease_seconds)
+            if not batch:
+                counts = queue.counts()
+                if counts['pending'] == 0 and counts['claimed'] == 0:
+                    break
+                # Other workers hold the remaining batches; wait in case their leases expire.
+                time.sleep(poll_seconds)
+                continue
+
+            results = [(claimed[0], result, error) for claimed, (result, error) in pool.imap(score_claimed, batch)]
+            queue.complete(worker_id, results)
+            scored += len(results)
+            print(f'[{worker_id}] {scored} positions scored')
+
+def export(queue_file, output_file):
+    '''
+    Writes every scored position to a CSV in PGN order, with the same columns as stockfish_scoring_v8.py.
+    '''
+    rows = 0
+    with ScoringQueue(queue_file) as queue, open(output_file, 'w') as out:
+        out.write(','.join(scoring.columns))
+        for pgn_file, game_idx, ply, fen, white_to_move, result, error in queue.iter_results():
+            if error is None:
+                try:
+                    _, row = scoring.result_to_row(fen, result, white_to_move)
+                except ValueError as ve:
+                    error = ve
+            if error is not None:
+                print(f'Error analyzing {pgn_file} game {game_idx} ply {ply}: {error}')
+                continue
+            out.write(f'\n{row}')
+            rows += 1
+    print(f'{rows} rows written to {output_file}')
+
+def run_local(queue_file, pgn_files, engine_path, num_workers, num_engines, batch_size, output_file, game_filter=None,
+              parse_workers=1):
+    '''
+    Runs coordinator and several worker processes on this machine, then exports the results.
+    '''
+    enqueue(queue_file, pgn_files, game_filter, parse_workers)
+
+    command = [sys.executable, os.path.abspath(__file__), 'worker', '--queue', queue_file,
+               '--engine', engine_path, '--engines', str(num_engines), '--batch-size', str(batch_size)]
+    workers = [subprocess.Popen(command) for _ in range(num_workers)]
+    for worker in workers:
+        worker.wait()
+
+    export(queue_file, output_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Distributed Stockfish scoring through a shared SQLite queue.')
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help='Shard PGN positions into the queue.')
+    worker_parser = subparsers.add_parser('worker', help='Claim and score batches from the queue.')
+    export_parser = subparsers.add_parser('export', help='Write scored positions to a CSV, in PGN order.')
+    local_parser = subparsers.add_parser('local', help='Enqueue, run local workers and export, on one box.')
+
+    for sub in (enqueue_parser, worker_parser, export_parser, local_parser):
+        sub.add_argument('--queue', default='stockfish_scoring_queue.sqlite', help='Path to the shared queue file.')
+    for sub in (enqueue_parser, local_parser):
+        sub.add_argument('pgn_files', nargs='+', help='PGN files to score (plain, .bz2, .gz or .zst).')
+        sub.add_argument('--min-rating', type=int, help='Only games where both players are rated at least this.')
+        sub.add_argument('--max-rating', type=int, help='Only games where both players are rated at most this.')
+        sub.add_argument('--time-control', action='append', help='Only games with this TimeControl header (repeatable).')
+        sub.add_argument('--date-from', help='Only games played on or after this date (YYYY.MM.DD).')
+        sub.add_argument('--date-to', help='Only games played on or before this date (YYYY.MM.DD).')
+        sub.add_argument('--parse-workers', type=int, default=1, help='Processes parsing each plain PGN file in parallel.')
+    for sub in (worker_parser, local_parser):
+        sub.add_argument('--engine', required=True, help='Path to the UCI engine binary.')
+        sub.add_argument('--engines', type=int, default=os.cpu_count(), help='Engine processes per worker.')
+        sub.add_argument('--batch-size', type=int, default=64, help='Positions claimed per batch.')
+    worker_parser.add_argument('--lease', type=int, default=600, help='Seconds before an unfinished batch is reclaimed.')
+    for sub in (export_parser, local_parser):
+        sub.add_argument('--output', default=scoring.output_file, help='Output CSV file.')
+    local_parser.add_argument('--workers', type=int, default=2, help='Number of local worker processes.')
+
+    args = parser.parse_args()
+
+    game_filter = None
+    if args.mode in ('enqueue', 'local'):
+        filter_options = {'min_rating': args.min_rating, 'max_rating': args.max_rating, 'time_controls': args.time_control,
+                          'date_from': args.date_from, 'date_to': args.date_to}
+        if any(value is not None for value in filter_options.values()):
+            game_filter = header_filter(**filter_options)
+
+    if args.mode == 'enqueue':
+        enqueue(args.queue, args.pgn_files, game_filter, args.parse_workers)
+    elif args.mode == 'worker':
+        work(args.queue, args.engine, args.engines, args.batch_size, args.lease)
+    elif args.mode == 'export':
+        export(args.queue, args.output)
+    else:
+        run_local(args.queue, args.pgn_files, args.engine, args.workers, args.engines, args.batch_size, args.output, game_filter,
+                  args.parse_workers)
+
+if __name__ == '__main__':
+    main()
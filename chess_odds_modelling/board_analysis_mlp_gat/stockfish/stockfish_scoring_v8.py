@@ -1,112 +1,201 @@
-import chess
-import chess.pgn
-import subprocess
+import os
+import sys
+from functools import partial
+
+from eval_cache import EvalCache
+from scoring_job import ScoringJob
+from uci_engine import EnginePool, mate_to_cp, parse_search_output, score_stability_rule
+
+# Shared single-pass PGN replay lives alongside the PGN to matrix scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pgn_to_matrix'))
+from pgn_positions import iter_pgn_positions
+from pgn_stream import header_filter
 
 
 depth = 20
 
-output_file = f'stockfish_scores_depth_{depth}.csv'
+# Search mode: 'depth' searches every position to the fixed depth above, while 'adaptive'
+# gives each position a node/time budget and stops early once the score has settled.
+search_mode = 'depth'
 
-with open(output_file, 'w') as out:
-    out.write('FEN,stockfish_score')
+# Adaptive mode settings.
+budget = 'nodes 2000000'    # Per-position limit, e.g. 'nodes 2000000' or 'movetime 500' (ms)
+stable_depths = 4           # Consecutive depths the score must agree over
+stable_tolerance_cp = 10    # Allowed spread of those scores, in centipawns
+min_depth = 10              # Never stop before this depth
 
+# Number of principal variations searched per position (extra lines come from the same search).
+multipv = 1
 
-def get_position_from_game(game, move_number):
-    '''
-    Extracts the position after the given move number from a single game.
+# How mate scores are handled: 'map' puts them on the centipawn scale, 'drop' skips the position.
+mate_policy = 'map'
+mate_value_cp = 2000        # Centipawn value of mate in 1
+mate_step_cp = 10           # Centipawns taken off per extra move until mate
 
-    :param game: A chess.pgn.Game object.
-    :param move_number: Move number for which the position is extracted.
-    :return: FEN string of the position after the given move number.
-    '''
-    board = game.board()
+# Header-only game filter (keyword arguments of pgn_stream.header_filter), e.g.
+# {'min_rating': 2000, 'time_controls': ['180+0'], 'date_from': '2024.12.01'}. Empty keeps every game.
+game_filter_options = {}
+
+# Number of Stockfish processes kept alive for the whole run (one per core).
+num_workers = os.cpu_count()
+
+if search_mode == 'adaptive':
+    go_command = f'go {budget}'
+    search = f'adaptive {budget} stable {stable_depths}x{stable_tolerance_cp}cp min depth {min_depth}'
+    output_file = f'stockfish_scores_adaptive_{budget.replace(" ", "_")}.csv'
+else:
+    go_command = f'go depth {depth}'
+    search = f'depth {depth}'
+    output_file = f'stockfish_scores_depth_{depth}.csv'
+if multipv > 1:
+    search += f' multipv {multipv}'
+
+# Output columns: scores are in pawns and, like mate distances, from White's perspective.
+columns = ['FEN', 'stockfish_score', 'score_type', 'mate', 'bound', 'depth', 'seldepth', 'nodes', 'nps', 'bestmove']
+columns += [f'multipv_{k}_score' for k in range(2, multipv + 1)]
 
-    # Play moves to reach the desired position
-    for i, move in enumerate(game.mainline_moves(), start=1):
-        board.push(move)
-        if i == move_number:
-            return board.fen(), board.turn  # Return FEN and side to move (True = White, False = Black)
+# Whether to carry on from the last checkpoint of an interrupted run (False starts over).
+resume = True
 
-    raise ValueError(f'Move number {move_number} exceeds the total moves in the game.')
+# Number of positions written per checkpoint.
+batch_size = 200
 
-def analyze_position_with_stockfish(fen, is_white_to_move, stockfish_path='stockfish'):
+# Persistent evaluation cache, shared by every run (keyed by position, search settings and engine build).
+cache_file = 'stockfish_eval_cache.sqlite'
+
+
+def analyze_position_with_stockfish(fen, engine):
     '''
-    Analyzes a chess position using Stockfish.
+    Analyzes a chess position using an already running Stockfish engine.
 
     :param fen: FEN string of the chess position.
+    :param engine: A uci_engine.UCIEngine instance.
+    :return: Parsed search result (see uci_engine.parse_search_output), from the side to move's perspective.
+    '''
+    # Search the position (the engine is reset with ucinewgame beforehand)
+    early_stop = None
+    if search_mode == 'adaptive':
+        early_stop = score_stability_rule(stable_depths, stable_tolerance_cp, min_depth)
+    output = engine.analyse(fen, go_command, early_stop)
+
+    result = parse_search_output(output)
+    if not result['lines']:
+        raise ValueError('Stockfish did not return a valid score.')
+    return result
+
+def normalize_score(info, is_white_to_move):
+    '''
+    Converts a parsed cp/mate score into pawns from White's perspective, applying the mate policy.
+
+    :param info: Parsed info dict (see uci_engine.parse_info_line).
     :param is_white_to_move: Boolean indicating if it's White's turn to move.
-    :param stockfish_path: Path to the Stockfish binary.
     :return: Normalized score from White's perspective.
     '''
-    # Start the Stockfish process
-    process = subprocess.Popen(
-        [stockfish_path],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        text=True
-    )
-
-    # Send commands to Stockfish
-    process.stdin.write(f'position fen {fen}\n')
-    process.stdin.write(f'go depth {depth}\n')
-    process.stdin.flush()
-
-    # Capture the output
-    output = []
-    while True:
-        line = process.stdout.readline().strip()
-        if line == '' and process.poll() is not None:
-            break
-        if 'bestmove' in line:
-            output.append(line)
-            break
-        output.append(line)
-
-    # Terminate the Stockfish process
-    process.terminate()
-
-    # Extract and normalize the score
-    for line in output:
-        if 'score cp' in line:
-            score = int(line.split('score cp ')[-1].split()[0])
-            return score / 100 if is_white_to_move else -score / 100
-
-    raise ValueError('Stockfish did not return a valid score.')
+    if info['mate'] is None:
+        score = info['cp']
+    elif mate_policy == 'map':
+        score = mate_to_cp(info['mate'], mate_value_cp, mate_step_cp)
+    else:
+        raise ValueError(f'Stockfish returned a mate score (mate {info["mate"]}).')
+    return score / 100 if is_white_to_move else -score / 100
+
+def result_to_row(fen, result, is_white_to_move):
+    '''
+    Flattens a search result into the output columns.
 
-def main():
-    pgn_file = '../PGN to Matrix/lichess_LordJedizor_2024-12-26.pgn'   # Replace with your PGN file path
-    stockfish_path = 'stockfish-windows-x86-64-sse41-popcnt/stockfish/stockfish-windows-x86-64-sse41-popcnt.exe'  # Replace with the path to your Stockfish binary
+    :return: Tuple of (normalized score, CSV row).
+    '''
+    main_line = result['lines'][0]
+    score = normalize_score(main_line, is_white_to_move)
+
+    # A bound from the side to move's perspective flips along with the score.
+    bound = main_line['bound']
+    if bound and not is_white_to_move:
+        bound = 'upperbound' if bound == 'lowerbound' else 'lowerbound'
+    mate = main_line['mate']
+    if mate is not None and not is_white_to_move:
+        mate = -mate
+
+    values = [fen, score, 'mate' if mate is not None else 'cp', mate, bound,
+              main_line.get('depth'), main_line.get('seldepth'), main_line.get('nodes'), main_line.get('nps'),
+              result['bestmove']]
+    for k in range(2, multipv + 1):
+        try:
+            values.append(normalize_score(result['lines'][k - 1], is_white_to_move))
+        except (IndexError, ValueError):
+            # Fewer legal moves than MultiPV lines, or a mate score under the 'drop' policy.
+            values.append(None)
+
+    row = ','.join('' if v is None else str(v) for v in values)
+    return score, row
+
+def score_position(engine, position, cache=None):
+    '''
+    Pool task: scores a single (game_number, ply, fen, is_white_to_move) position.
+    Positions already in the evaluation cache are not searched again.
 
-    try:
-        with open(pgn_file, 'r') as f:
-            game_number = 1
-            while True:
-                game = chess.pgn.read_game(f)
-                if game is None:
-                    break  # No more games in the PGN file
+    :return: Tuple of (search result, error), where exactly one is None.
+    '''
+    _, _, fen, _ = position
+
+    if cache is not None:
+        result = cache.get(fen)
+        if result is not None:
+            return result, None
 
-                print(f'\nAnalyzing Game {game_number}')
-                board = game.board()
+    try:
+        result = analyze_position_with_stockfish(fen, engine)
+    except ValueError as ve:
+        return None, ve
 
-                total_moves = sum(1 for _ in game.mainline_moves())
+    if cache is not None:
+        cache.put(fen, result)
+    return result, None
 
-                for n in range(1, total_moves + 1):
-                    # Get the FEN and side to move
-                    fen, is_white_to_move = get_position_from_game(game, n)
+def main():
+    pgn_file = '../PGN to Matrix/lichess_LordJedizor_2024-12-26.pgn'   # Replace with your PGN file path
+    stockfish_path = 'stockfish-windows-x86-64-sse41-popcnt/stockfish/stockfish-windows-x86-64-sse41-popcnt.exe'  # Replace with the path to your Stockfish binary
 
-                    # Analyze the position using Stockfish
+    try:
+        header = ','.join(columns)
+        job_params = {'pgn_file': pgn_file, 'search': search, 'mate_policy': mate_policy, 'columns': header,
+                      'game_filter': game_filter_options}
+        with ScoringJob(output_file, header, job_params, batch_size=batch_size, resume=resume) as job, \
+                EvalCache(cache_file, stockfish_path, search) as cache, \
+                EnginePool(stockfish_path, num_workers=num_workers, options={'MultiPV': multipv}) as pool:
+            current_game = None
+            task = partial(score_position, cache=cache)
+
+            if job.resume_point != (0, 0):
+                print(f'Resuming after game {job.resume_point[0]}, ply {job.resume_point[1]}')
+
+            # Positions are analysed concurrently, but come back in PGN order.
+            game_filter = header_filter(**game_filter_options) if game_filter_options else None
+            positions = job.skip_done(iter_pgn_positions(pgn_file, game_filter))
+            for position, (result, error) in pool.imap(task, positions):
+                game_number, n, fen, is_white_to_move = position
+
+                if game_number != current_game:
+                    print(f'\nAnalyzing Game {game_number}')
+                    current_game = game_number
+
+                if error is None:
                     try:
-                        score = analyze_position_with_stockfish(fen, is_white_to_move, stockfish_path)
-                        move_type = 'W' if is_white_to_move else 'B'
-                        move_number = (n + 1) // 2
-                        print(f'Move {move_number} ({move_type}): Score = {score:.2f}')
-                        csv_row = f'\n{fen},{score}'
-                        with open(output_file, 'a') as out:
-                            out.write(csv_row)
+                        score, row = result_to_row(fen, result, is_white_to_move)
                     except ValueError as ve:
-                        print(f'Error analyzing move {n}: {ve}')
+                        error = ve
+
+                if error is not None:
+                    print(f'Error analyzing move {n}: {error}')
+                    job.record(game_number, n)
+                    continue
+
+                move_type = 'W' if is_white_to_move else 'B'
+                move_number = (n + 1) // 2
+                print(f'Move {move_number} ({move_type}): Score = {score:.2f} (depth {result["lines"][0].get("depth")})')
+                job.record(game_number, n, row)
 
-                game_number += 1
+            print(f'\n{cache.report()}')
 
     except Exception as e:
         print(f'Error: {e}')
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+'''
+A stand-in UCI engine for exercising the scoring pipeline without Stockfish.
+Scores are a deterministic function of the FEN, printed as iterative-deepening info lines.
+Set STUB_UCI_DELAY (seconds per search) to mimic search cost.
+'''
+
+import hashlib
+import os
+import sys
+import time
+
+
+delay = float(os.environ.get('STUB_UCI_DELAY', '0'))
+
+
+def fake_score(fen):
+    '''
+    Deterministic pseudo-score (centipawns, side to move) for a FEN.
+    '''
+    return int(hashlib.md5(fen.encode()).hexdigest(), 16) % 400 - 200
+
+
+def search(fen, depth, multipv):
+    '''
+    Prints info lines for depths 1..depth, then the bestmove line.
+    '''
+    base = fake_score(fen)
+    time.sleep(delay)
+    for d in range(1, depth + 1):
+        for k in range(1, multipv + 1):
+            nodes = 1000 * d * d
+            print(f'info depth {d} seldepth {d + 2} multipv {k} score cp {base - 15 * (k - 1)} '
+                  f'nodes {nodes} nps 1000000 time {nodes // 1000} pv e2e4')
+    print('bestmove e2e4', flush=True)
+
+
+def main():
+    fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+    multipv = 1
+
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+
+        if command == 'uci':
+            print('id name stub_uci_engine')
+            print('uciok', flush=True)
+        elif command == 'isready':
+            print('readyok', flush=True)
+        elif command == 'setoption' and tokens[2].lower() == 'multipv':
+            multipv = int(tokens[-1])
+        elif command == 'position' and tokens[1] == 'fen':
+            fen = ' '.join(tokens[2:8])
+        elif command == 'go':
+            # Depth-limited searches go to that depth; node/time budgets get a fixed depth.
+            depth = int(tokens[tokens.index('depth') + 1]) if 'depth' in tokens else 12
+            search(fen, depth, multipv)
+        elif command == 'quit':
+            break
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+import os
+import queue
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Integer-valued fields of a UCI 'info' line.
+INFO_INT_FIELDS = ('depth', 'seldepth', 'multipv', 'nodes', 'nps', 'time', 'hashfull', 'tbhits')
+
+
+def parse_info_line(line):
+    '''
+    Parses a UCI 'info' line that carries a score.
+
+    :param line: A line of UCI engine output.
+    :return: Dict with the integer fields present (depth, seldepth, multipv, nodes, nps, time, ...),
+             'cp' and 'mate' (one of them None), 'bound' ('lowerbound', 'upperbound' or None) and 'pv'
+             (list of UCI moves), all from the side to move's perspective; or None if the line has no score.
+    '''
+    tokens = line.split()
+    if not tokens or tokens[0] != 'info' or 'score' not in tokens:
+        return None
+
+    info = {'multipv': 1, 'cp': None, 'mate': None, 'bound': None, 'pv': []}
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token in INFO_INT_FIELDS:
+            info[token] = int(tokens[i + 1])
+            i += 2
+        elif token == 'score':
+            info[tokens[i + 1]] = int(tokens[i + 2])
+            i += 3
+        elif token in ('lowerbound', 'upperbound'):
+            info['bound'] = token
+            i += 1
+        elif token == 'pv':
+            # The principal variation always runs to the end of the line.
+            info['pv'] = tokens[i + 1:]
+            break
+        elif token == 'string':
+            break
+        else:
+            i += 1
+
+    return info
+
+
+def parse_info_score(line):
+    '''
+    Parses the depth and score out of an iterative-deepening 'info' line.
+    Bound-only scores (lowerbound/upperbound) and secondary MultiPV lines are ignored.
+
+    :param line: A line of UCI engine output.
+    :return: Tuple of (depth, kind, value), where kind is 'cp' or 'mate', or None if the line carries no score.
+    '''
+    info = parse_info_line(line)
+    if info is None or 'depth' not in info or info['bound'] is not None or info['multipv'] != 1:
+        return None
+    if info['mate'] is not None:
+        return info['depth'], 'mate', info['mate']
+    return info['depth'], 'cp', info['cp']
+
+
+def parse_search_output(output):
+    '''
+    Collects the final result of a search from its full output, for every MultiPV line.
+    Exact scores are preferred over bound-only ones from an interrupted iteration.
+
+    :param output: List of engine output lines, as returned by UCIEngine.analyse.
+    :return: Dict with 'bestmove' and 'lines', a list of parsed info dicts ordered by multipv
+             (see parse_info_line); 'lines' is empty if the engine reported no score.
+    '''
+    exact, bounded = {}, {}
+    bestmove = None
+    for line in output:
+        if line.startswith('bestmove'):
+            bestmove = line.split()[1]
+            continue
+        info = parse_info_line(line)
+        if info is None:
+            continue
+        (bounded if info['bound'] else exact)[info['multipv']] = info
+
+    lines = {**bounded, **exact}
+    return {'bestmove': bestmove, 'lines': [lines[k] for k in sorted(lines)]}
+
+
+def mate_to_cp(mate, mate_value_cp=2000, mate_step_cp=10):
+    '''
+    Maps a mate score onto the centipawn scale: shorter mates score further from zero.
+
+    :param mate: Mate distance in moves, from the side to move's perspective (0 = side to move is mated).
+    :param mate_value_cp: Centipawn value of a mate in one (being mated already scores one step beyond it).
+    :param mate_step_cp: Centipawns taken off per extra move until mate.
+    :return: Centipawn score from the side to move's perspective.
+    '''
+    if mate > 0:
+        return mate_value_cp - mate_step_cp * (mate - 1)
+    # Mate 0 (already mated) < mate -1 < mate -2 < ...
+    return -(mate_value_cp - mate_step_cp * (-mate - 1))
+
+
+def score_stability_rule(stable_depths=4, tolerance_cp=10, min_depth=10):
+    '''
+    Builds an early-stop rule for UCIEngine.analyse, which fires once the score has settled.
+
+    :param stable_depths: Number of consecutive depths the score must stay within tolerance for.
+    :param tolerance_cp: Maximum spread of centipawn scores over those depths.
+    :param min_depth: Depth below which the search is never stopped.
+    :return: Callable taking an output line and returning True when the search should stop.
+    '''
+    recent = []
+
+    def rule(line):
+        parsed = parse_info_score(line)
+        if parsed is None:
+            return False
+        depth, kind, value = parsed
+        if depth < min_depth:
+            return False
+
+        recent.append((kind, value))
+        del recent[:-stable_depths]
+        if len(recent) < stable_depths:
+            return False
+
+        # A forced mate is stable once the same mate distance repeats; otherwise centipawns must agree.
+        kinds = {k for k, _ in recent}
+        if kinds == {'mate'}:
+            return len({v for _, v in recent}) == 1
+        if kinds == {'cp'}:
+            values = [v for _, v in recent]
+            return max(values) - min(values) <= tolerance_cp
+        return False
+
+    return rule
+
+
+class UCIEngine:
+    '''
+    A long-lived UCI engine process (e.g. Stockfish), reused across many positions.
+    '''
+
+    def __init__(self, engine_path, threads=1, hash_mb=16, options=None):
+        '''
+        Starts the engine process and completes the UCI handshake.
+
+        :param engine_path: Path to the UCI engine binary.
+        :param threads: Number of search threads given to the engine.
+        :param hash_mb: Size of the engine's transposition table, in MB.
+        :param options: Dict of any further UCI options, e.g. {'MultiPV': 3}.
+        '''
+        self.engine_path = engine_path
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.options = options or {}
+        self.process = subprocess.Popen(
+            [engine_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+
+        # Handshake, then applies options before the first search.
+        self.send('uci')
+        self.read_until('uciok')
+        self.send(f'setoption name Threads value {threads}')
+        self.send(f'setoption name Hash value {hash_mb}')
+        for name, value in self.options.items():
+            self.send(f'setoption name {name} value {value}')
+        self.ready()
+
+    def send(self, command):
+        '''
+        Sends a single command line to the engine.
+        '''
+        self.process.stdin.write(f'{command}\n')
+        self.process.stdin.flush()
+
+    def read_until(self, token):
+        '''
+        Reads engine output until a line starting with the given token.
+
+        :param token: First word of the line to stop at (e.g. 'bestmove').
+        :return: List of all lines read, including the final one.
+        '''
+        output = []
+        while True:
+            line = self.process.stdout.readline()
+            if line == '':
+                raise RuntimeError(f'UCI engine exited while waiting for "{token}".')
+            line = line.strip()
+            output.append(line)
+            if line.startswith(token):
+                return output
+
+    def ready(self):
+        '''
+        Blocks until the engine has processed all previous commands.
+        '''
+        self.send('isready')
+        self.read_until('readyok')
+
+    def new_game(self):
+        '''
+        Resets the engine's search state (hash, history), as a fresh process would have it.
+        '''
+        self.send('ucinewgame')
+        self.ready()
+
+    def analyse(self, fen, go_command, early_stop=None):
+        '''
+        Searches a single position and returns the raw engine output.
+
+        :param fen: FEN string of the chess position.
+        :param go_command: Search limits, e.g. 'go depth 20' or 'go nodes 2000000'.
+        :param early_stop: Optional callable, given each output line, returning True to stop the search early.
+        :return: List of output lines, ending with the 'bestmove' line.
+        '''
+        self.new_game()
+        self.send(f'position fen {fen}')
+        self.send(go_command)
+        if early_stop is None:
+            return self.read_until('bestmove')
+
+        output = []
+        stopped = False
+        while True:
+            line = self.process.stdout.readline()
+            if line == '':
+                raise RuntimeError('UCI engine exited while waiting for "bestmove".')
+            line = line.strip()
+            output.append(line)
+            if line.startswith('bestmove'):
+                return output
+            # The engine still answers with a bestmove after 'stop', which ends the loop.
+            if not stopped and early_stop(line):
+                self.send('stop')
+                stopped = True
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def quit(self):
+        '''
+        Asks the engine to exit, killing it if it does not do so promptly.
+        '''
+        if self.is_alive():
+            try:
+                self.send('quit')
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+
+
+class EnginePool:
+    '''
+    A pool of long-lived UCI engines, one per worker, that positions are farmed out to.
+    Results are streamed back in the same order as the positions were given.
+    '''
+
+    def __init__(self, engine_path, num_workers=None, threads=1, hash_mb=16, options=None, max_pending=None):
+        '''
+        :param engine_path: Path to the UCI engine binary.
+        :param num_workers: Number of engine processes (defaults to one per core).
+        :param threads: Search threads per engine.
+        :param hash_mb: Transposition table size per engine, in MB.
+        :param options: Dict of any further UCI options, applied to every engine.
+        :param max_pending: Maximum number of positions queued ahead of the output.
+        '''
+        self.engine_path = engine_path
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.options = options
+        self.max_pending = max_pending or 4 * self.num_workers
+
+        # Idle engines are handed out to worker threads through a queue.
+        self.engines = queue.Queue()
+        for _ in range(self.num_workers):
+            self.engines.put(UCIEngine(engine_path, threads, hash_mb, options))
+
+        self.executor = ThreadPoolExecutor(max_workers=self.num_workers)
+
+    def _run(self, task, item):
+        '''
+        Runs a task on an idle engine, replacing the engine if its process has died.
+        '''
+        engine = self.engines.get()
+        try:
+            return task(engine, item)
+        finally:
+            if not engine.is_alive():
+                engine = UCIEngine(self.engine_path, self.threads, self.hash_mb, self.options)
+            self.engines.put(engine)
+
+    def imap(self, task, items):
+        '''
+        Applies task(engine, item) to every item concurrently, yielding results in input order.
+
+        :param task: Function taking a UCIEngine and an item.
+        :param items: Iterable of items (consumed lazily).
+        :return: Generator of (item, result) tuples, in the order of items.
+        '''
+        pending = deque()
+        for item in items:
+            pending.append((item, self.executor.submit(self._run, task, item)))
+            # Keeps a bounded window of work in flight, so long inputs stream through.
+            if len(pending) >= self.max_pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+    def close(self):
+        '''
+        Shuts down the worker threads and all engine processes.
+        '''
+        self.executor.shutdown(wait=True)
+        while not self.engines.empty():
+            self.engines.get().quit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
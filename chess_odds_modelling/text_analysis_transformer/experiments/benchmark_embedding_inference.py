@@ -0,0 +1,83 @@
+'''
+Parity check and CPU benchmark of the optimised embedding inference modes (see EmbeddingService): dynamic int8
+quantisation of the linear layers, torch.compile of the encoder sub-layers, both, and thread pinning.
+
+Every mode's layer outputs are compared with those of the full-precision eager encoder on the same positions,
+and its throughput is reported in positions/sec.
+'''
+
+import os
+import time
+
+import pandas as pd
+import torch
+
+from embedding_service import EmbeddingService
+
+
+def parity(reference, candidate, fens):
+    '''
+    Compares the layer outputs of two services on the same positions.
+
+    :return: List of (layer, max absolute difference, mean cosine similarity) tuples, with the cosine similarity
+             taken per position and token over the embedding dimension.
+    '''
+    expected = reference.embed(fens).float()
+    actual = candidate.embed(fens).float()
+    return [(layer,
+             float((expected[i] - actual[i]).abs().max()),
+             float(torch.nn.functional.cosine_similarity(expected[i], actual[i], dim=-1).mean()))
+            for i, layer in enumerate(reference.layers)]
+
+
+def benchmark(service, fens, repeats=3):
+    '''
+    Returns the best throughput (positions/sec) over several passes over fens, after a warm-up batch
+    (which also triggers compilation).
+    '''
+    service.embed(fens[:service.batch_size])
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in service.iter_embeddings(fens):
+            pass
+        best = max(best, len(fens) / (time.perf_counter() - start))
+    return best
+
+
+if __name__ == '__main__':
+
+    scores_file = '../../board_analysis_mlp_gat/mlp_for_stockfish_scores/stockfish_scores_depth_20_interim.csv'
+    num_positions = 2048
+    batch_size = 256
+    cores = None  # e.g. [0, 1, 2, 3] to pin to four cores
+    min_cosine_similarity = 0.99
+
+    # Layers and pooling as used downstream (see embedding_index.py); None / None checks every full layer output.
+    extraction = {'layers': None, 'pooling': None}
+
+    fens = list(pd.read_csv(scores_file)['FEN'].sample(num_positions, random_state=42))
+
+    modes = {
+        'fp32 eager': {},
+        'int8 dynamic': {'quantise': True},
+        'fp32 compiled': {'compile_layers': True},
+        'int8 compiled': {'quantise': True, 'compile_layers': True},
+    }
+
+    reference = EmbeddingService(batch_size=batch_size, cores=cores, **extraction)
+    print(f'{torch.get_num_threads()} threads' + (f', pinned to cores {sorted(os.sched_getaffinity(0))}' if cores else ''))
+
+    results = []
+    for name, options in modes.items():
+        service = reference if not options else EmbeddingService(batch_size=batch_size, cores=cores, **extraction, **options)
+        checks = parity(reference, service, fens[:batch_size])
+        worst_cosine = min(cosine for _, _, cosine in checks)
+        worst_difference = max(difference for _, difference, _ in checks)
+        throughput = benchmark(service, fens)
+        results.append((name, throughput, worst_difference, worst_cosine))
+        print(f'{name:15s} {throughput:8.0f} positions/sec   max |diff| {worst_difference:.4f}   '
+              f'min mean cosine {worst_cosine:.5f}   {"ok" if worst_cosine >= min_cosine_similarity else "PARITY FAILED"}')
+
+    baseline = results[0][1]
+    print('\nSpeed-up over fp32 eager: ' + ', '.join(f'{name} {throughput / baseline:.2f}x' for name, throughput, _, _ in results[1:]))
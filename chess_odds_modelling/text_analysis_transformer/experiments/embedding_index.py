@@ -0,0 +1,276 @@
+'''
+Persistent nearest-position index over position embeddings (e.g. pooled layer outputs of embedding_service.py),
+answering "which historical positions look most like this one", with each neighbour's game outcome and Stockfish score.
+
+Vectors are L2-normalised on the way in, so the inner product is the cosine similarity (as F.cosine_similarity
+in generate_chess_embeddings_v5.py). Search is either exact, one matrix-vector product over every vector, or
+approximate with an inverted file (IVF): vectors are bucketed by their nearest k-means centroid, and a query only
+scans the nprobe buckets whose centroids are closest to it.
+
+Like the embedding store, the index is a directory of .npy shards with an index.json, and grows one shard per
+add() call. Shard k holds:
+
+    vectors_{k:05d}.npy     (rows, dim) normalised embeddings
+    fens_{k:05d}.npy        fixed-width bytes, FEN of every position
+    scores_{k:05d}.npy      float32 Stockfish score (NaN if unknown)
+    outcomes_{k:05d}.npy    float32 game result for White: 1, 0.5 or 0 (NaN if unknown)
+    game_idx_{k:05d}.npy    int64 game of every position (-1 if unknown)
+    lists_{k:05d}.npy       int32 IVF bucket of every vector (once IVF is trained)
+'''
+
+import json
+import os
+
+import numpy as np
+
+
+RESULTS = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}
+
+_FIELDS = ('vectors', 'fens', 'scores', 'outcomes', 'game_idx')
+
+
+def normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(similarities, k):
+    # Indices of the k largest similarities, best first.
+    k = min(k, len(similarities))
+    top = np.argpartition(-similarities, k - 1)[:k] if k < len(similarities) else np.arange(len(similarities))
+    return top[np.argsort(-similarities[top], kind='stable')]
+
+
+def kmeans(vectors, num_lists, iterations=10, seed=42):
+    '''
+    Spherical k-means (cosine) centroids of normalised vectors.
+
+    :return: np.ndarray of (num_lists, dim) normalised centroids.
+    '''
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(vectors, centroids)
+        counts = np.bincount(assignments, minlength=num_lists)
+        order = np.argsort(assignments, kind='stable')
+        sums = np.zeros_like(centroids)
+        sums[counts > 0] = np.add.reduceat(vectors[order], (np.cumsum(counts) - counts)[counts > 0])
+        # Empty buckets are re-seeded with random vectors.
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalise(sums)
+    return centroids
+
+
+def assign_lists(vectors, centroids, chunk_size=65536):
+    '''
+    Returns the index of the nearest centroid of every vector, as int32.
+    '''
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        assignments[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignments
+
+
+class EmbeddingIndex:
+    '''
+    Incrementally built, persistent cosine-similarity index of position embeddings with their metadata.
+    '''
+
+    def __init__(self, path, dim=None):
+        '''
+        :param path: Index directory (created if missing, otherwise opened).
+        :param dim: Embedding width, required when creating a new index.
+        '''
+        self.path = path
+        index_file = os.path.join(path, 'index.json')
+        if os.path.exists(index_file):
+            with open(index_file, 'r') as f:
+                self.index = json.load(f)
+        else:
+            if dim is None:
+                raise ValueError(f'{path} does not exist yet; give dim to create it.')
+            os.makedirs(path, exist_ok=True)
+            self.index = {'rows': 0, 'dim': dim, 'ivf': None, 'shards': []}
+            self._write_index()
+
+        ivf = self.index['ivf']
+        self.centroids = np.load(os.path.join(path, ivf['centroids'])) if ivf else None
+        self._loaded = None
+
+    def __len__(self):
+        return self.index['rows']
+
+    def _write_index(self):
+        tmp_file = os.path.join(self.path, 'index.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_file, os.path.join(self.path, 'index.json'))
+
+    def add(self, vectors, fens, scores=None, outcomes=None, game_idx=None):
+        '''
+        Adds a batch of embeddings as a new shard.
+
+        :param vectors: (rows, dim) embeddings (any float dtype; normalised here).
+        :param fens: FEN of every row.
+        :param scores: Optional Stockfish score of every row.
+        :param outcomes: Optional game result of every row, as 1 / 0.5 / 0 or as a PGN result string.
+        :param game_idx: Optional game of every row.
+        '''
+        rows = len(fens)
+        vectors = normalise(vectors).reshape(rows, -1)
+        if vectors.shape[1] != self.index['dim']:
+            raise ValueError(f"Embeddings have width {vectors.shape[1]}, but the index holds width {self.index['dim']}.")
+        if outcomes is not None:
+            outcomes = [RESULTS.get(o, np.nan) if isinstance(o, str) else o for o in outcomes]
+
+        shard_idx = len(self.index['shards'])
+        arrays = {
+            'vectors': vectors,
+            'fens': np.array(fens, dtype=bytes),
+            'scores': np.full(rows, np.nan, dtype=np.float32) if scores is None else np.asarray(scores, dtype=np.float32),
+            'outcomes': np.full(rows, np.nan, dtype=np.float32) if outcomes is None else np.asarray(outcomes, dtype=np.float32),
+            'game_idx': np.full(rows, -1, dtype=np.int64) if game_idx is None else np.asarray(game_idx, dtype=np.int64),
+        }
+        if self.centroids is not None:
+            arrays['lists'] = assign_lists(vectors, self.centroids)
+
+        shard = {'rows': rows}
+        for name, array in arrays.items():
+            shard[name] = f'{name}_{shard_idx:05d}.npy'
+            np.save(os.path.join(self.path, shard[name]), array)
+        self.index['shards'].append(shard)
+        self.index['rows'] += rows
+        self._write_index()
+        self._loaded = None
+
+    def train_ivf(self, num_lists=None, sample_size=100_000, iterations=10, seed=42):
+        '''
+        Trains IVF centroids on a sample of the indexed vectors and buckets every vector (later additions are
+        bucketed as they are added). Re-training replaces the buckets.
+
+        :param num_lists: Number of buckets (defaults to about sqrt(rows)).
+        '''
+        vectors = self._load()['vectors']
+        num_lists = num_lists or max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+        self.centroids = kmeans(sample, min(num_lists, len(sample)), iterations, seed)
+
+        np.save(os.path.join(self.path, 'centroids.npy'), self.centroids)
+        for shard in self.index['shards']:
+            shard['lists'] = shard['vectors'].replace('vectors', 'lists')
+            shard_vectors = np.load(os.path.join(self.path, shard['vectors']), mmap_mode='r')
+            np.save(os.path.join(self.path, shard['lists']), assign_lists(shard_vectors, self.centroids))
+        self.index['ivf'] = {'centroids': 'centroids.npy', 'num_lists': len(self.centroids)}
+        self._write_index()
+        self._loaded = None
+
+    def _load(self):
+        # Every shard concatenated in memory, with the rows of each IVF bucket contiguous in 'order'.
+        if self._loaded is None:
+            shards = self.index['shards']
+            loaded = {name: np.concatenate([np.load(os.path.join(self.path, s[name])) for s in shards])
+                      if shards else np.empty((0, self.index['dim']) if name == 'vectors' else 0) for name in _FIELDS}
+            if self.centroids is not None and shards:
+                lists = np.concatenate([np.load(os.path.join(self.path, s['lists'])) for s in shards])
+                loaded['order'] = np.argsort(lists, kind='stable')
+                loaded['offsets'] = np.searchsorted(lists[loaded['order']], np.arange(len(self.centroids) + 1))
+            self._loaded = loaded
+        return self._loaded
+
+    def search(self, queries, k=10, nprobe=None):
+        '''
+        Finds the k most similar indexed positions of every query.
+
+        :param queries: (dim,) or (num_queries, dim) embeddings.
+        :param nprobe: Number of IVF buckets to scan (exact search over every vector if None or if IVF is not trained).
+        :return: Tuple of (similarities, rows), each (num_queries, k), best first (rows of -1 pad short results).
+        '''
+        loaded = self._load()
+        queries = normalise(np.atleast_2d(queries))
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+
+        if nprobe is None or self.centroids is None:
+            all_similarities = queries @ loaded['vectors'].T
+            for q, query_similarities in enumerate(all_similarities):
+                top = _top_k(query_similarities, k)
+                similarities[q, :len(top)], rows[q, :len(top)] = query_similarities[top], top
+            return similarities, rows
+
+        order, offsets = loaded['order'], loaded['offsets']
+        for q, query in enumerate(queries):
+            probes = _top_k(self.centroids @ query, nprobe)
+            candidates = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes])
+            candidate_similarities = loaded['vectors'][candidates] @ query
+            top = _top_k(candidate_similarities, k)
+            similarities[q, :len(top)], rows[q, :len(top)] = candidate_similarities[top], candidates[top]
+        return similarities, rows
+
+    def neighbours(self, query, k=10, nprobe=None):
+        '''
+        Returns the k positions most similar to one query embedding, with their metadata.
+
+        :return: List of dicts with fen, similarity, score, outcome and game_idx, best first.
+        '''
+        loaded = self._load()
+        similarities, rows = self.search(query, k, nprobe)
+        return [{'fen': loaded['fens'][row].decode('ascii'), 'similarity': float(similarity),
+                 'score': float(loaded['scores'][row]), 'outcome': float(loaded['outcomes'][row]),
+                 'game_idx': int(loaded['game_idx'][row])}
+                for similarity, row in zip(similarities[0], rows[0]) if row >= 0]
+
+
+# Builds the index from every position of a PGN database, then looks up the nearest positions of the last one.
+if __name__ == '__main__':
+
+    import shutil
+    import sys
+    import time
+    from collections import deque
+
+    import pandas as pd
+
+    from embedding_service import EmbeddingService
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'board_analysis_mlp_gat', 'pgn_to_matrix'))
+    from pgn_stream import iter_pgn_games, iter_mainline_positions
+
+    pgn_file = '../../board_analysis_mlp_gat/pgn_to_matrix/lichess_LordJedizor_2024-12-26.pgn'
+    scores_file = '../../board_analysis_mlp_gat/mlp_for_stockfish_scores/stockfish_scores_depth_20_interim.csv'
+    index_dir = 'chess_embedding_index'
+
+    # Stockfish scores, where the position has been scored.
+    scores = dict(zip(*(pd.read_csv(scores_file)[column] for column in ('FEN', 'stockfish_score')))) if os.path.exists(scores_file) else {}
+
+    service = EmbeddingService(layers=[-1], pooling='mean')
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    index = None
+
+    # The service regroups games into batches, so the metadata of every position queued is consumed in the same order.
+    pending = deque()
+
+    def iter_games():
+        for game_idx, headers, movetext in iter_pgn_games(pgn_file):
+            fens = [fen for _, _, fen, _ in iter_mainline_positions(headers, movetext, game_idx)]
+            pending.extend((game_idx, headers.get('Result')) for _ in fens)
+            yield fens
+
+    for batch, embeddings in service.iter_embeddings(iter_games()):
+        game_idx, outcomes = zip(*(pending.popleft() for _ in batch))
+        if index is None:
+            index = EmbeddingIndex(index_dir, dim=embeddings.shape[-1])
+        index.add(embeddings[0].numpy(), batch, [scores.get(fen, np.nan) for fen in batch], outcomes, game_idx)
+    index.train_ivf()
+    print(f'Indexed {len(index)} positions in {index_dir}')
+
+    query = embeddings[0][-1].numpy()
+    for nprobe in (None, 8):
+        start = time.perf_counter()
+        neighbours = index.neighbours(query, k=5, nprobe=nprobe)
+        print(f"\n{'Exact' if nprobe is None else f'IVF (nprobe={nprobe})'} search in {(time.perf_counter() - start) * 1000:.2f} ms:")
+        for neighbour in neighbours:
+            print(neighbour)
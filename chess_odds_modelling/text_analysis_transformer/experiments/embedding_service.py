@@ -0,0 +1,336 @@
+'''
+Embedding service for the chess transformer: the model is loaded once, and any number of positions (e.g. every
+position of thousands of games) are embedded batch by batch under torch.inference_mode, with the outputs of the
+multi-headed attention layers (as generate_embeddings captures them), optionally pooled, streamed to disk as they
+are produced.
+
+An embedding store is a directory of .npy shards with an index.json, like the board datasets and feature stores
+of board_analysis_mlp_gat. Shard k holds, for a batch of consecutive positions:
+
+    fens_{k:05d}.npy                  fixed-width bytes, the FEN of every position
+    layer_{l:02d}_{k:05d}.npy         (rows, seq_len, embedding_dim), layer l's attention output for every position,
+                                      or (rows, embedding_dim) / (rows, num_squares, embedding_dim) when pooled
+
+Only the layers kept by the service are written; the index records them, with the pooling and dtype.
+'''
+
+import json
+import os
+import queue
+import sys
+import threading
+from functools import partial
+
+import chess
+import numpy as np
+import torch
+from chess_transformers.configs import import_config
+from chess_transformers.play import load_model
+
+from generate_chess_embeddings_v5 import extract_model_inputs_from_features, extract_model_inputs_from_fen
+
+# Precomputed position features live with the board analysis FEN to graph scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'board_analysis_mlp_gat', 'fen_to_graph'))
+from position_features import PositionFeatureStore
+
+
+def iter_batches(fens, batch_size):
+    '''
+    Regroups FENs, given one by one or in batches of any size, into lists of batch_size (the last may be shorter).
+    '''
+    batch = []
+    for item in fens:
+        if isinstance(item, str):
+            batch.append(item)
+        else:
+            batch.extend(item)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+# The board encoder's sequence: turn and the four castling rights, then one token per square (a1, b1, ..., h8).
+NUM_FLAG_TOKENS = 5
+
+POOLINGS = (None, 'last', 'mean', 'squares')
+
+
+class _StopForward(Exception):
+    # Raised by the hook of the last kept layer, to skip the rest of the forward pass.
+    pass
+
+
+class EmbeddingService:
+    '''
+    Chess transformer board encoder, loaded once, with hooks capturing the MHA outputs of the kept layers.
+
+    By default every layer's full (seq_len, embedding_dim) output is kept for every position. To cut memory, keep
+    only some layers and pool each one as soon as it is produced, so only the reduced vectors are ever held:
+    'last' keeps the last token, 'mean' averages over all tokens, and 'squares' keeps the tokens of given squares.
+    '''
+
+    def __init__(self, config_name="CT-EFT-85", batch_size=256, num_threads=None, feature_store=None,
+                 layers=None, pooling=None, squares=None, dtype='float32', quantise=False, compile_layers=False, cores=None):
+        '''
+        :param config_name: Name of the configuration for the chess-transformers model.
+        :param batch_size: Positions per forward pass.
+        :param num_threads: Intra-op threads (defaults to the number of cores).
+        :param feature_store: Optional precomputed position feature store to read the inputs from.
+        :param layers: Indices of the encoder layers to keep (all by default; negative indices count from the end).
+        :param pooling: None (full outputs), 'last', 'mean' or 'squares'.
+        :param squares: Squares kept by 'squares' pooling, as names ('e4') or python-chess square indices.
+        :param dtype: 'float32' or 'float16', applied to the kept outputs as they are captured.
+        :param quantise: Whether to dynamically quantise the encoder's linear layers to int8 (int8 weights,
+                         activations quantised on the fly); check the outputs against an fp32 service first.
+        :param compile_layers: Whether to torch.compile every encoder sub-layer. The hooks stay in eager mode
+                               around the compiled sub-layers, so layer selection and pooling still apply.
+        :param cores: Optional CPU cores to pin the process to (Linux only); num_threads then defaults to their count.
+        '''
+        if pooling not in POOLINGS:
+            raise ValueError(f"Unknown pooling '{pooling}' (expected one of {POOLINGS}).")
+        if (pooling == 'squares') != (squares is not None):
+            raise ValueError("squares must be given with, and only with, pooling='squares'.")
+
+        if cores is not None:
+            os.sched_setaffinity(0, cores)
+        torch.set_num_threads(num_threads or (len(cores) if cores is not None else os.cpu_count()))
+        self.config_name = config_name
+        self.batch_size = batch_size
+        self.feature_store = PositionFeatureStore(feature_store) if feature_store is not None else None
+        self.pooling = pooling
+        self.squares = None if squares is None else [chess.parse_square(sq) if isinstance(sq, str) else int(sq) for sq in squares]
+        self.dtype = np.dtype(dtype)
+        self.torch_dtype = {np.dtype('float32'): torch.float32, np.dtype('float16'): torch.float16}[self.dtype]
+
+        model = load_model(import_config(config_name))
+        model.eval()
+        # load_model returns a torch.compile wrapper; the encoder is hooked on the original module.
+        self.board_encoder = getattr(model, '_orig_mod', model).board_encoder
+
+        encoder_layers = self.board_encoder.encoder_layers
+        if quantise:
+            # In place, so the (MHA) modules the hooks go on are kept; only their linear layers are swapped.
+            torch.ao.quantization.quantize_dynamic(self.board_encoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        if compile_layers:
+            for encoder_layer in encoder_layers:
+                for sublayer in encoder_layer:
+                    sublayer.forward = torch.compile(sublayer.forward, dynamic=True)
+
+        self.layers = sorted({layer % len(encoder_layers) for layer in (range(len(encoder_layers)) if layers is None else layers)})
+        self._captured = []
+        self.hooks = [encoder_layers[layer][0].register_forward_hook(partial(self._capture, layer))  # MultiHeadAttention
+                      for layer in self.layers]
+
+    def _capture(self, layer, module, input, output):
+        if self.pooling == 'last':
+            output = output[:, -1]
+        elif self.pooling == 'mean':
+            output = output.mean(dim=1)
+        elif self.pooling == 'squares':
+            output = output[:, [NUM_FLAG_TOKENS + square for square in self.squares]]
+        # A copy when pooled, so the full output can be freed rather than kept alive by a view.
+        self._captured.append(output.to(self.torch_dtype, copy=self.pooling is not None))
+        if layer == self.layers[-1]:
+            raise _StopForward
+
+    @property
+    def num_layers(self):
+        return len(self.layers)
+
+    def model_inputs(self, fens):
+        '''
+        Encodes a batch of FENs as the board encoder's input tensors.
+
+        :return: Tuple of (turns, white kingside, white queenside, black kingside, black queenside) tensors of
+                 shape (num_positions, 1), and board positions of shape (num_positions, 64).
+        '''
+        if self.feature_store is not None:
+            inputs = extract_model_inputs_from_features(self.feature_store.lookup(fens))
+        else:
+            inputs = [np.array(column) for column in zip(*(extract_model_inputs_from_fen(fen) for fen in fens))]
+        *flags, board_positions = (torch.from_numpy(np.asarray(column, dtype=np.int64)) for column in inputs)
+        return (*(flag.unsqueeze(1) for flag in flags), board_positions)
+
+    def embed(self, fens):
+        '''
+        Runs one forward pass over a batch of FENs, stopping after the last kept layer.
+
+        :return: Tensor of shape (num_kept_layers, num_positions, ...), where ... is (seq_len, embedding_dim)
+                 without pooling, (embedding_dim,) for 'last' and 'mean', and (num_squares, embedding_dim) for 'squares'.
+        '''
+        inputs = self.model_inputs(fens)
+        self._captured = []
+        with torch.inference_mode():
+            try:
+                self.board_encoder(*inputs)
+            except _StopForward:
+                pass
+        captured, self._captured = self._captured, []
+        return torch.stack(captured)
+
+    def iter_embeddings(self, fens):
+        '''
+        Embeds a stream of positions, batch_size at a time.
+
+        :param fens: Iterable of FENs, or of FEN batches (e.g. one list per game).
+        :return: Generator of (FEN batch, embeddings tensor as returned by embed) tuples.
+        '''
+        for batch in iter_batches(fens, self.batch_size):
+            yield batch, self.embed(batch)
+
+    def write(self, fens, path):
+        '''
+        Embeds a stream of positions into an embedding store, one shard per batch. Shards are written by a
+        background thread while the next batch is embedded.
+
+        :param fens: Iterable of FENs, or of FEN batches.
+        :param path: Store directory (existing shards are replaced).
+        :return: Number of positions written.
+        '''
+        with EmbeddingStoreWriter(path, self.layers, self.dtype, self.config_name, self.pooling, self.squares) as writer:
+            for batch, embeddings in self.iter_embeddings(fens):
+                writer.add(batch, embeddings.numpy())
+        return writer.rows
+
+    def close(self):
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+
+
+class EmbeddingStoreWriter:
+    '''
+    Writes embedding shards on a background thread (bounded queue), then the index last.
+    '''
+
+    def __init__(self, path, layers, dtype='float32', config_name=None, pooling=None, squares=None, max_pending=2):
+        '''
+        :param layers: Encoder layer indices of the embeddings, in the order they are given to add().
+        '''
+        self.path = path
+        self.layers = list(layers)
+        self.dtype = np.dtype(dtype)
+        self.index = {'rows': 0, 'layers': self.layers, 'dtype': self.dtype.name, 'config': config_name,
+                      'pooling': pooling, 'squares': squares, 'shards': []}
+
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith('.npy') or name == 'index.json':
+                os.remove(os.path.join(path, name))
+
+        self.jobs = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @property
+    def rows(self):
+        return self.index['rows']
+
+    def add(self, fens, embeddings):
+        '''
+        Queues a shard: the FENs of a batch and their embeddings, of shape (num_layers, batch, ...), in layers order.
+        '''
+        if self.error is not None:
+            raise self.error
+        shard_idx = len(self.index['shards'])
+        self.index['shards'].append({'fens': f'fens_{shard_idx:05d}.npy', 'rows': len(fens),
+                                     'layers': [f'layer_{layer:02d}_{shard_idx:05d}.npy' for layer in self.layers]})
+        self.index['rows'] += len(fens)
+        self.index['shape'] = list(embeddings.shape[2:])
+        self.jobs.put((shard_idx, fens, embeddings))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            shard_idx, fens, embeddings = job
+            if self.error is not None:
+                continue
+            try:
+                shard = self.index['shards'][shard_idx]
+                np.save(os.path.join(self.path, shard['fens']), np.array(fens, dtype=bytes))
+                for embedding, layer_file in zip(embeddings, shard['layers']):
+                    np.save(os.path.join(self.path, layer_file), embedding.astype(self.dtype, copy=False))
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        '''
+        Waits for every queued shard, then writes the index (last, so a complete index means a complete store).
+        '''
+        self.jobs.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        tmp_file = os.path.join(self.path, 'index.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_file, os.path.join(self.path, 'index.json'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class EmbeddingStore:
+    '''
+    Read-only view over an embedding store, with every shard memory-mapped.
+    '''
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            self.index = json.load(f)
+        self.path = path
+
+    def __len__(self):
+        return self.index['rows']
+
+    def fens(self):
+        return [fen.decode('ascii') for s in self.index['shards'] for fen in np.load(os.path.join(self.path, s['fens']))]
+
+    def iter_layer(self, layer):
+        '''
+        Yields the memory-mapped shards of one encoder layer (by its index in the encoder), of shape (rows, ...), in order.
+        '''
+        if layer not in self.index['layers']:
+            raise KeyError(f"Layer {layer} is not in {self.path} (it has layers {self.index['layers']}).")
+        position = self.index['layers'].index(layer)
+        for s in self.index['shards']:
+            yield np.load(os.path.join(self.path, s['layers'][position]), mmap_mode='r')
+
+    def layer(self, layer):
+        '''
+        Returns one layer's embeddings of every position, concatenated in memory.
+        '''
+        return np.concatenate(list(self.iter_layer(layer)))
+
+
+# Embeds every position of a PGN database, streaming the layer outputs to disk.
+if __name__ == '__main__':
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'board_analysis_mlp_gat', 'pgn_to_matrix'))
+    from pgn_stream import iter_pgn_games, iter_mainline_positions
+
+    pgn_file = '../../board_analysis_mlp_gat/pgn_to_matrix/lichess_LordJedizor_2024-12-26.pgn'
+    output_dir = 'chess_embeddings'
+    batch_size = 256
+    num_threads = None
+    dtype = 'float16'
+
+    # Layers to keep and how to pool them (None keeps every layer's full output).
+    layers = [-1]
+    pooling = 'mean'
+
+    # One FEN batch per game (positions after every move), regrouped into batch_size forward passes.
+    games = ([fen for _, _, fen, _ in iter_mainline_positions(headers, movetext, game_idx)]
+             for game_idx, headers, movetext in iter_pgn_games(pgn_file))
+
+    service = EmbeddingService(batch_size=batch_size, num_threads=num_threads, layers=layers, pooling=pooling, dtype=dtype)
+    rows = service.write(games, output_dir)
+    print(f'Embedded {rows} positions into {output_dir} (layers {service.layers}, {pooling} pooling, {dtype})')
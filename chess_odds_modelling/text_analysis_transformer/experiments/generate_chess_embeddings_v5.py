@@ -1,9 +1,13 @@
 import chess
 import chess.pgn
 from io import StringIO
-import torch
-from chess_transformers.play import load_model
-from chess_transformers.configs import import_config
+import os
+import sys
+import numpy as np
+
+# Precomputed position features live with the board analysis FEN to graph scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'board_analysis_mlp_gat', 'fen_to_graph'))
+from position_features import bitboards_to_squares
 
 # Define the PGN text directly in the script
 PGN_TEXT = """
@@ -133,80 +137,54 @@ def extract_model_inputs_from_fen(fen):
     return turn, white_kingside, white_queenside, black_kingside, black_queenside, board_positions
 
 
+def extract_model_inputs_from_features(features):
+    """
+    Extract the same model inputs as extract_model_inputs_from_fen, for a whole batch of positions,
+    from their precomputed features (see position_features.py) instead of python-chess boards.
+    :param features: Structured array of position features, one record per position.
+    :return: A tuple of arrays (turns, white kingside, white queenside, black kingside, black queenside, board positions),
+             the last of shape (num_positions, 64).
+    """
+    castling = features['castling']
+    has_right = lambda square_mask: ((castling & np.uint64(square_mask)) != 0).astype(np.int64)
+
+    # Piece type (1-6) on every square, 0 if empty, for both colours (planes are P..K then p..k).
+    occupied = bitboards_to_squares(features['pieces'])  # (num_positions, 12, 64)
+    piece_types = np.tile(np.arange(1, 7), 2)
+    board_positions = np.einsum('p,nps->ns', piece_types, occupied.astype(np.int64))
+
+    return (features['turn'].astype(np.int64),
+            has_right(chess.BB_H1), has_right(chess.BB_A1), has_right(chess.BB_H8), has_right(chess.BB_A8),
+            board_positions)
 
-def generate_embeddings(fens, config_name="CT-EFT-85"):
+
+def generate_embeddings(fens, config_name="CT-EFT-85", feature_store=None, service=None):
     """
     Extract outputs directly from the multi-headed attention layers during a full encoder forward pass.
     Return the outputs as a single tensor.
     :param fens: List of FENs representing game states.
     :param config_name: Name of the configuration for the chess-transformers model.
+    :param feature_store: Optional precomputed position feature store to read the inputs from.
+    :param service: Optional EmbeddingService (see embedding_service.py) with the model already loaded;
+                    otherwise the model is loaded for this call only.
     :return: A tensor of shape (num_layers, num_moves, seq_len, embedding_dim).
     """
-    # Load model and configuration
-    CONFIG = import_config(config_name)
-    model = load_model(CONFIG)
-
-    # Ensure the model is in evaluation mode
-    model.eval()
-
-    # Prepare inputs
-    turns, white_kingside, white_queenside, black_kingside, black_queenside, board_positions = [], [], [], [], [], []
-
-    for fen in fens:
-        turn, wk, wq, bk, bq, bp = extract_model_inputs_from_fen(fen)
-        turns.append(turn)
-        white_kingside.append(wk)
-        white_queenside.append(wq)
-        black_kingside.append(bk)
-        black_queenside.append(bq)
-        board_positions.append(bp)
+    if service is None:
+        from embedding_service import EmbeddingService  # Imported here, as embedding_service imports this module.
+        service = EmbeddingService(config_name, batch_size=len(fens), feature_store=feature_store)
 
-    # Convert to tensors
-    turns = torch.tensor(turns).unsqueeze(1)  # Shape: (num_moves, 1)
-    white_kingside = torch.tensor(white_kingside).unsqueeze(1)
-    white_queenside = torch.tensor(white_queenside).unsqueeze(1)
-    black_kingside = torch.tensor(black_kingside).unsqueeze(1)
-    black_queenside = torch.tensor(black_queenside).unsqueeze(1)
-    board_positions = torch.tensor(board_positions)  # Shape: (num_moves, 64)
-
-    # Store attention outputs
-    attention_outputs = []
-
-    # Define a hook function to capture MHA outputs
-    def hook(module, input, output):
-        attention_outputs.append(output)
-
-    # Register hooks on all MHA layers
-    hooks = []
-    for encoder_layer in model._orig_mod.board_encoder.encoder_layers:
-        mha_layer = encoder_layer[0]  # MultiHeadAttention
-        hooks.append(mha_layer.register_forward_hook(hook))
-
-    # Run the full encoder to trigger hooks
-    with torch.no_grad():
-        model._orig_mod.board_encoder(
-            turns,
-            white_kingside,
-            white_queenside,
-            black_kingside,
-            black_queenside,
-            board_positions
-        )
-
-    # Remove hooks after forward pass
-    for hook in hooks:
-        hook.remove()
-
-    # Combine attention outputs into a single tensor
-    attention_tensor = torch.stack(attention_outputs)  # Shape: (num_layers, num_moves, seq_len, embedding_dim)
-
-    return attention_tensor
+    return service.embed(fens)
 
 
 
 
 # Main flow
 if __name__ == "__main__":
+    from embedding_service import EmbeddingService
+
+    # Load the model once, for both games
+    service = EmbeddingService()
+
     # Parse PGN text into FENs
     print("Parsing PGN text...")
     fens = parse_pgn_to_fens(PGN_TEXT2)
@@ -214,7 +192,7 @@ if __name__ == "__main__":
 
     # Generate contextual embeddings
     print("\nGenerating contextual embeddings...")
-    embeddings = generate_embeddings(fens)
+    embeddings = generate_embeddings(fens, service=service)
 
     # Print the embeddings
     print("\nEmbeddings shape:", embeddings.shape)  # Expected: (num_moves, embedding_dim)
@@ -227,7 +205,7 @@ if __name__ == "__main__":
     fens = parse_pgn_to_fens(PGN_TEXT)
 
     # Generate contextual embeddings
-    embeddings = generate_embeddings(fens)
+    embeddings = generate_embeddings(fens, service=service)
 
     # Print the embeddings
     print("Embeddings (first move):", first_state)
@@ -0,0 +1,265 @@
+'''
+Pool of long-lived headless Chrome sessions for scraping oddschecker.
+
+Starting Chrome costs seconds of wall time and CPU, so instead of one browser per URL per poll, sessions are
+kept open and reused across URLs and polls. Each session is health-checked before it is handed out and is
+recycled (quit and relaunched) after max_pages page loads, or once its memory has grown by more than
+max_memory_growth_mb since its first page.
+
+Instead of a fixed 2 s sleep after loading, a fetch waits for the document to finish loading and, optionally,
+for a CSS selector to appear (up to wait_timeout seconds).
+
+Usage:
+    with BrowserPool() as pool:
+        for x in range(300):
+            content = pool.get_page_source(url)
+            ...
+
+    with pool.session() as driver:   # a raw WebDriver, for anything other than page source
+        pool.load_page(driver, url)
+'''
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+try:
+    import psutil
+except ImportError:  # Falls back to the JavaScript heap size for the memory check.
+    psutil = None
+
+
+# A commonly used user-agent
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+              "AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/90.0.4430.85 Safari/537.36")
+
+
+def chrome_options(headless=True, user_agent=USER_AGENT):
+    '''
+    Chrome options as used by the scrapers: the user-agent above, in headless mode.
+    '''
+    options = Options()
+    options.add_argument(f'user-agent={user_agent}')
+    if headless:
+        options.add_argument('--headless')  # run browser in headless mode
+    return options
+
+
+class BrowserSession:
+    '''
+    One Chrome WebDriver, with the number of pages it has loaded and its memory use after its first page.
+    '''
+
+    def __init__(self, options, page_load_timeout):
+        self.driver = webdriver.Chrome(options=options)
+        self.driver.set_page_load_timeout(page_load_timeout)
+        self.pages = 0
+        self.baseline_memory = None
+
+    def is_alive(self):
+        try:
+            return self.driver.execute_script('return 1') == 1
+        except WebDriverException:
+            return False
+
+    def memory_mb(self):
+        '''
+        Resident memory of the browser process tree (with psutil), else the page's JavaScript heap, in MB.
+        Returns None if neither can be read.
+        '''
+        try:
+            if psutil is not None:
+                process = psutil.Process(self.driver.service.process.pid)
+                processes = [process] + process.children(recursive=True)
+                return sum(p.memory_info().rss for p in processes) / 2**20
+            return self.driver.execute_script('return performance.memory.usedJSHeapSize') / 2**20
+        except Exception:
+            return None
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    '''
+    Hands out reusable Chrome sessions to one caller at a time each (thread-safe).
+    '''
+
+    def __init__(self, size=1, max_pages=200, max_memory_growth_mb=500, page_load_timeout=30, wait_timeout=10,
+                 headless=True, user_agent=USER_AGENT):
+        '''
+        :param size: Most sessions open at once; callers beyond that wait for a free one.
+        :param max_pages: Page loads after which a session is relaunched.
+        :param max_memory_growth_mb: Memory growth since the first page after which a session is relaunched.
+        :param page_load_timeout: Seconds before a page load is abandoned (and its session relaunched).
+        :param wait_timeout: Longest load_page waits for the page to be ready before reading it anyway.
+        '''
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_growth_mb = max_memory_growth_mb
+        self.page_load_timeout = page_load_timeout
+        self.wait_timeout = wait_timeout
+        self.options = chrome_options(headless, user_agent)
+        self.idle = []                           # Sessions ready to hand out.
+        self.open = 0                            # Sessions launched (or launching) and not yet quit.
+        self.condition = threading.Condition()   # Guards idle, open and closed; notified whenever a slot frees up.
+        self.closed = False
+        atexit.register(self.close)  # Do not leave Chrome processes behind.
+
+    def _acquire(self):
+        # Waits for an idle session or a free slot (released or discarded sessions notify the condition).
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise RuntimeError('BrowserPool is closed.')
+                if self.idle:
+                    return self.idle.pop()
+                if self.open < self.size:
+                    self.open += 1
+                    break
+                self.condition.wait()
+        return self._launch()
+
+    def _launch(self):
+        # Launches a session into a slot already counted in open, giving the slot back if Chrome fails to start.
+        try:
+            return BrowserSession(self.options, self.page_load_timeout)
+        except Exception:
+            with self.condition:
+                self.open -= 1
+                self.condition.notify()
+            raise
+
+    def _discard(self, session):
+        session.quit()
+        with self.condition:
+            self.open -= 1
+            self.condition.notify()
+
+    def _release(self, session, broken=False):
+        if broken or session.pages >= self.max_pages:
+            self._discard(session)
+            return
+        if session.pages:
+            memory = session.memory_mb()
+            if memory is not None:
+                if session.baseline_memory is None:
+                    session.baseline_memory = memory
+                elif memory - session.baseline_memory > self.max_memory_growth_mb:
+                    self._discard(session)
+                    return
+        with self.condition:
+            if not self.closed:
+                self.idle.append(session)
+                self.condition.notify()
+                return
+        self._discard(session)
+
+    @contextmanager
+    def session(self):
+        '''
+        Context manager yielding a healthy WebDriver for the caller's exclusive use until the block exits.
+        Every page it loads counts towards recycling; a WebDriverException out of the block recycles it.
+        '''
+        session = self._acquire()
+        while not session.is_alive():
+            # Relaunches into the same slot, so no waiting caller can take it in between.
+            session.quit()
+            session = self._launch()
+        broken = False
+        try:
+            yield session.driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            session.pages += 1
+            self._release(session, broken)
+
+    def load_page(self, driver, url, wait_for=None):
+        '''
+        Opens the given URL in a driver from session() and waits for it to be ready (up to wait_timeout seconds).
+
+        :param wait_for: CSS selector to wait for (e.g. the odds cells), else only waits for the document to finish
+                         loading.
+        '''
+        driver.get(url)
+        wait = WebDriverWait(driver, self.wait_timeout)
+        try:
+            wait.until(lambda d: d.execute_script('return document.readyState') == 'complete')
+            if wait_for:
+                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, wait_for)))
+        except TimeoutException:
+            pass  # Read whatever has rendered (e.g. a game with no prices).
+
+    def get_page_source(self, url, wait_for=None, retries=1):
+        '''
+        Opens the given URL in a pooled session and returns the page source.
+
+        :param wait_for: CSS selector to wait for before reading the page (see load_page).
+        :param retries: Further attempts, each on a fresh session, if the browser fails.
+        '''
+        for attempt in range(retries + 1):
+            try:
+                with self.session() as driver:
+                    self.load_page(driver, url, wait_for)
+                    return driver.page_source
+            except WebDriverException:
+                if attempt == retries:
+                    raise
+
+    def close(self):
+        '''
+        Quits every idle session; sessions in use are quit when released.
+        '''
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.condition.notify_all()  # Waiting callers raise rather than wait forever.
+        for session in idle:
+            self._discard(session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Times repeated fetches through the pool against launching a browser per fetch (as the scrapers used to).
+if __name__ == '__main__':
+
+    url = 'https://www.oddschecker.com/table-tennis/'
+    num_fetches = 5
+
+    start = time.perf_counter()
+    for _ in range(num_fetches):
+        driver = webdriver.Chrome(options=chrome_options())
+        try:
+            driver.get(url)
+            time.sleep(2)
+            driver.page_source
+        finally:
+            driver.quit()
+    per_fetch_new = (time.perf_counter() - start) / num_fetches
+
+    with BrowserPool() as pool:
+        pool.get_page_source(url)  # Launches the session.
+        start = time.perf_counter()
+        for _ in range(num_fetches):
+            pool.get_page_source(url)
+        per_fetch_pooled = (time.perf_counter() - start) / num_fetches
+
+    print(f'New browser per fetch: {per_fetch_new:.2f} s/fetch, pooled session: {per_fetch_pooled:.2f} s/fetch')
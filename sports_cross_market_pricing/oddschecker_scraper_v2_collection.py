@@ -1,38 +1,14 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from browser_pool import BrowserPool
 import time
 
+# Long-lived headless browser session, reused across polls.
+pool = BrowserPool()
+
 def get_page_source(url: str) -> str:
     '''
-    Launches a headless browser, opens the given URL, and returns the page source.
+    Opens the given URL in a pooled headless browser session, and returns the page source once the odds cells have loaded.
     '''
-    # Create a new Chrome Options instance and set headless mode
-    chrome_options = Options()
-    # A commonly used user-agent
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                                "Chrome/90.0.4430.85 Safari/537.36")
-    chrome_options.add_argument('--headless')  # run browser in headless mode
-
-    # Create a new WebDriver instance using the Chrome driver
-    driver = webdriver.Chrome(options=chrome_options)
-
-    try:
-        # Navigate to the given URL
-        driver.get(url)
-        
-        time.sleep(2)
-
-        # Extract the page source (HTML) for subsequent parsing/scraping
-        page_source = driver.page_source
-        
-        #table = driver.find_element(By.ID, "myTable")
-        
-    finally:
-        # Close the driver after we have retrieved the content
-        driver.quit()
-
-    return page_source
+    return pool.get_page_source(url, wait_for='[data-o]')
 
 if __name__ == '__main__':
     
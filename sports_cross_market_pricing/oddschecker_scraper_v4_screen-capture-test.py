@@ -1,45 +1,25 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from browser_pool import BrowserPool
+import base64
 import time
 
 
+# Long-lived headless browser session, reused across polls.
+pool = BrowserPool()
+
 def headless_screenshot(url: str, output_path: str):
-    chrome_options = Options()
-    # A commonly used user-agent
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                                "Chrome/90.0.4430.85 Safari/537.36")
-    chrome_options.add_argument("--headless")  # run in headless mode
-
-    driver = webdriver.Chrome(options=chrome_options)
-    try:
-        driver.get(url)
-        
-        time.sleep(2)
+    with pool.session() as driver:
+        pool.load_page(driver, url, wait_for='[data-o]')
         driver.execute_script("window.scrollBy(0, 850);")
 
         # Capture screenshot (full browser window)
         driver.save_screenshot(output_path)
         print(f"Screenshot saved to: {output_path}")
-    finally:
-        driver.quit()
 
 
-import base64
-
 def save_fullpage_screenshot(url, output_path):
-    chrome_options = Options()
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                                "Chrome/90.0.4430.85 Safari/537.36")
-    chrome_options.add_argument("--headless")
-
-    driver = webdriver.Chrome(options=chrome_options)
-    try:
+    with pool.session() as driver:
         # 1. Go to your URL
-        driver.get(url)
-        
-        time.sleep(2)
+        pool.load_page(driver, url, wait_for='[data-o]')
 
         # 2. Get the page's layout metrics using the DevTools Protocol
         metrics = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})
@@ -57,11 +37,15 @@ def save_fullpage_screenshot(url, output_path):
             "deviceScaleFactor": 1,
         })
 
-        # 4. Capture screenshot via DevTools
-        result = driver.execute_cdp_cmd("Page.captureScreenshot", {
-            "format": "png",
-            "fromSurface": True
-        })
+        try:
+            # 4. Capture screenshot via DevTools
+            result = driver.execute_cdp_cmd("Page.captureScreenshot", {
+                "format": "png",
+                "fromSurface": True
+            })
+        finally:
+            # Restore the window size, as the session goes back to the pool.
+            driver.execute_cdp_cmd("Emulation.clearDeviceMetricsOverride", {})
 
         # 5. Decode the base64 screenshot string and save to file
         with open(output_path, "wb") as file:
@@ -69,41 +53,12 @@ def save_fullpage_screenshot(url, output_path):
 
         print(f"Full-page screenshot saved to: {output_path}")
 
-    finally:
-        driver.quit()
-
 
 def get_page_source(url: str) -> str:
     '''
-    Launches a headless browser, opens the given URL, and returns the page source.
+    Opens the given URL in a pooled headless browser session, and returns the page source once the odds cells have loaded.
     '''
-    # Create a new Chrome Options instance and set headless mode
-    chrome_options = Options()
-    # A commonly used user-agent
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                                "Chrome/90.0.4430.85 Safari/537.36")
-    chrome_options.add_argument('--headless')  # run browser in headless mode
-
-    # Create a new WebDriver instance using the Chrome driver
-    driver = webdriver.Chrome(options=chrome_options)
-
-    try:
-        # Navigate to the given URL
-        driver.get(url)
-        
-        time.sleep(2)
-
-        # Extract the page source (HTML) for subsequent parsing/scraping
-        page_source = driver.page_source
-        
-        #table = driver.find_element(By.ID, "myTable")
-        
-    finally:
-        # Close the driver after we have retrieved the content
-        driver.quit()
-
-    return page_source
+    return pool.get_page_source(url, wait_for='[data-o]')
 
 
 if __name__ == '__main__':
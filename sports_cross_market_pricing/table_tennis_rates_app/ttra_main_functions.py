@@ -145,52 +145,59 @@ def find_games(table_tennis_url = 'https://www.oddschecker.com/table-tennis/'):
 
 
 
+### SHARED BROWSER SESSIONS.
+
+import threading
+
+# Pool of long-lived Chrome sessions shared by every scrape (created on first use).
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+def get_browser_pool():
+    
+    # Imports necessary libraries.
+    import os
+    import sys
+    
+    global _browser_pool
+    
+    # The pool lives alongside the oddschecker scrapers.
+    scrapers_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    if scrapers_dir not in sys.path:
+        sys.path.append(scrapers_dir)
+    from browser_pool import BrowserPool
+    
+    # Creates the pool once, even if called from several threads.
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool()
+    
+    return _browser_pool
+
+
+
 ### SCRAPES AND ANALYSES ODDS.
 
-def scrape_and_analyse_odds(url):
+def scrape_and_analyse_odds(url, pool=None):
     
     # Imports necessary libraries.
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
     import time
     from datetime import date
     import os
 
     # Get today's date in YYYY-MM-DD format
     today = date.today().strftime('%Y-%m-%d')
+    
+    # Uses the shared browser sessions unless given a pool.
+    if pool is None:
+        pool = get_browser_pool()
 
     # Sub-function to get page source html.
     def get_page_source(url: str) -> str:
         '''
-        Launches a headless browser, opens the given URL, and returns the page source.
+        Opens the given URL in a pooled headless browser session, and returns the page source once the odds cells have loaded.
         '''
-        # Create a new Chrome Options instance and set headless mode
-        chrome_options = Options()
-        # A commonly used user-agent
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                                    "Chrome/90.0.4430.85 Safari/537.36")
-        chrome_options.add_argument('--headless')  # run browser in headless mode
-
-        # Create a new WebDriver instance using the Chrome driver
-        driver = webdriver.Chrome(options=chrome_options)
-
-        try:
-            # Navigate to the given URL
-            driver.get(url)
-            
-            time.sleep(2)
-
-            # Extract the page source (HTML) for subsequent parsing/scraping
-            page_source = driver.page_source
-            
-            #table = driver.find_element(By.ID, "myTable")
-            
-        finally:
-            # Close the driver after we have retrieved the content
-            driver.quit()
-
-        return page_source
+        return pool.get_page_source(url, wait_for='[data-o]')
 
     # Carry out function.
     